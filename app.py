@@ -1,15 +1,32 @@
 import os
 import io
 import csv
+import tempfile
 from datetime import date, datetime
-
-from flask import Flask, render_template, request, redirect, url_for, session as flask_session, flash, send_file
-from werkzeug.security import generate_password_hash, check_password_hash
+from functools import lru_cache
+
+from flask import Flask, render_template, request, redirect, url_for, session as flask_session, flash, send_file, make_response, jsonify
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 
-from models import db, Teacher, Case, CaseService, Session
+from models import db, Teacher, Case, CaseService, SessionHours, ArchivedCase, touch_case, touch_teacher
+from models import new_session, hours_to_minutes, legacy_hours
 from utils import encrypt_code, decrypt_code, generate_query_code, today_after_jan10, service_label
+from usage import monthly_usage, used_hours, project_run_out
 from mailer import send_reset_email
+from assets import init_assets
+from archive import archive_fiscal_years
+from hashing import generate_password_hash, check_password_hash, HashPoolBusy, HASH_RETRY_AFTER
+from hashing import stats as hash_stats
+from querybudget import query_budget
+from profiling import init_profiling
+from replica import READ_BIND, read_database_url, read_only, mark_recent_write
+from batchlookup import parse_lines, verify_batch, BatchLookupError
+from sync import apply_batch, changes_since, SyncError, API_TOKEN_MAX_AGE
 
 serializer = None  # 之後在 create_app 內設定
 
@@ -33,6 +50,108 @@ def require_login():
         return redirect(url_for("teacher_login"))
     return None
 
+
+def export_csv(t, cases, year, suffix="", used=None):
+    """
+    年度 CSV（live 案件與封存案件共用；兩者欄位名稱一致）。
+    used：{case_id: {項目: 已用時數}}（live 案件傳 usage.used_hours 的結果）；
+    沒傳就由 c.sessions 加總（封存案件）。
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([
+        "年度", "用戶", "服務對象", "單位", "狀態",
+        "項目", "開始日", "核給時數",
+        "上課日期", "定向時數", "生活時數",
+        "已用時數", "剩餘時數",
+    ])
+
+    for c in cases:
+        svc_map = {s.service_type: s for s in c.services}
+        if used is not None:
+            case_used = used.get(c.id, {})
+        else:
+            case_used = {}
+            for sess in c.sessions:
+                for stype, h in legacy_hours(sess).items():
+                    case_used[stype] = case_used.get(stype, 0.0) + h
+        # 逐筆 session 展開；若無 session 也輸出一列案件資訊
+        if c.sessions:
+            for sess in sorted(c.sessions, key=lambda x: x.session_date):
+                for stype, s in svc_map.items():
+                    # 每列都帶上該項目資訊，方便做行政對帳
+                    writer.writerow([
+                        c.fiscal_year,
+                        t.full_name,
+                        c.student_name,
+                        c.agency_name,
+                        c.status,
+                        service_label(stype),
+                        s.start_date.isoformat(),
+                        s.granted_hours,
+                        sess.session_date.isoformat(),
+                        sess.hours_orientation,
+                        sess.hours_life,
+                        case_used.get(stype, 0.0),
+                        s.granted_hours - case_used.get(stype, 0.0),
+                    ])
+        else:
+            for stype, s in svc_map.items():
+                writer.writerow([
+                    c.fiscal_year,
+                    t.full_name,
+                    c.student_name,
+                    c.agency_name,
+                    c.status,
+                    service_label(stype),
+                    s.start_date.isoformat(),
+                    s.granted_hours,
+                    "", "", "",
+                    case_used.get(stype, 0.0),
+                    s.granted_hours - case_used.get(stype, 0.0),
+                ])
+
+    mem = io.BytesIO()
+    mem.write(output.getvalue().encode("utf-8-sig"))
+    mem.seek(0)
+
+    filename = f"工作時數E指通_{t.full_name}_{year}{suffix}.csv"
+    return send_file(mem, as_attachment=True, download_name=filename, mimetype="text/csv")
+
+
+def export_batch_csv(agency_name, results):
+    """
+    單位批次查詢結果：每位服務對象每個項目一列。
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["服務對象", "單位", "年度", "狀態", "項目", "核給時數", "已用時數", "剩餘時數", "查詢結果"])
+    for r in results:
+        if r["status"] != "ok":
+            note = "超過單次查詢上限，請分批再查" if r["status"] == "skipped" else "資料不存在或查詢碼錯誤"
+            writer.writerow([r["student_name"], "", "", "", "", "", "", "", note])
+            continue
+        for stype, s in r["services"].items():
+            writer.writerow([
+                r["student_name"],
+                r["agency_name"],
+                r["fiscal_year"],
+                r["case_status"],
+                service_label(stype),
+                s["granted"],
+                s["used"],
+                s["remaining"],
+                "成功",
+            ])
+
+    mem = io.BytesIO()
+    mem.write(output.getvalue().encode("utf-8-sig"))
+    mem.seek(0)
+
+    filename = f"工作時數E指通_單位查詢_{agency_name}_{date.today().isoformat()}.csv"
+    return send_file(mem, as_attachment=True, download_name=filename, mimetype="text/csv")
+
+
 def create_app():
     app = Flask(__name__)
 
@@ -55,6 +174,18 @@ def create_app():
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_pre_ping": True}
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # ✅ 選配：唯讀 replica（單位查詢/匯出走這裡）；沒設就全部走主庫
+    read_url = read_database_url()
+    if read_url:
+        app.config["SQLALCHEMY_BINDS"] = {READ_BIND: read_url}
+
+    # =========================
+    # Jinja bytecode cache：新的 gunicorn worker 不必每次重新編譯模板
+    # =========================
+    jinja_cache_dir = os.environ.get("JINJA_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "whe-jinja-cache")
+    os.makedirs(jinja_cache_dir, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(jinja_cache_dir)}
+
     # =========================
     # ✉️ SMTP 寄信設定
     # =========================
@@ -69,6 +200,29 @@ def create_app():
     # 套件初始化
     # =========================
     db.init_app(app)
+    init_assets(app)
+    app.after_request(mark_recent_write)
+    init_profiling(app)
+
+    # 雜湊佇列滿了：快速回 503，請用戶端稍後重試（不要讓請求在 gunicorn 裡越堆越多）
+    @app.errorhandler(HashPoolBusy)
+    def hash_pool_busy(e):
+        db.session.rollback()
+        if request.path.startswith("/api/"):
+            resp = jsonify(error="系統忙碌中，請稍後再試。")
+        else:
+            resp = make_response("系統忙碌中，請稍後再試。")
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(HASH_RETRY_AFTER)
+        return resp
+
+    # 內部指標（設了 METRICS_TOKEN 才開放）
+    @app.get("/internal/metrics")
+    def internal_metrics():
+        token = os.environ.get("METRICS_TOKEN")
+        if not token or request.headers.get("X-Metrics-Token") != token:
+            return make_response("Not Found", 404)
+        return jsonify(pid=os.getpid(), hashing=hash_stats())
 
     global serializer
     serializer = URLSafeTimedSerializer(app.config["SECRET_KEY"])
@@ -81,7 +235,7 @@ def create_app():
         return render_template("index.html")
 
     # -------------------------
-    # 自動年度清理：隔年 1/10 後刪除去年資料
+    # 自動年度結轉：隔年 1/10 後把去年（含更早）資料搬進封存表
     # -------------------------
     @app.before_request
     def cleanup_last_year_if_needed():
@@ -94,12 +248,10 @@ def create_app():
             return
 
         last_year = today.year - 1
-        old_cases = Case.query.filter_by(fiscal_year=last_year).all()
-        if old_cases:
-            for c in old_cases:
-                db.session.delete(c)
+        archived = archive_fiscal_years(last_year)
+        if archived:
             db.session.commit()
-            print(f"🧹 AUTO CLEANUP: deleted {len(old_cases)} cases of year {last_year}")
+            print(f"🧹 AUTO CLEANUP: archived {archived} cases of year <= {last_year}")
 
     # =========================
     # ROUTES START
@@ -140,7 +292,7 @@ def create_app():
                 t = Teacher(
                     full_name=full_name,
                     email=email,
-                    password_hash=generate_password_hash(password),
+                    password_hash=generate_password_hash(password, site="signup"),
                     last_login_at=datetime.utcnow(),
                 )
                 db.session.add(t)
@@ -157,7 +309,7 @@ def create_app():
                 flash("您尚未註冊，請先註冊再登入。", "warning")
                 return redirect(url_for("teacher_login"))
 
-            if not check_password_hash(t.password_hash, password):
+            if not check_password_hash(t.password_hash, password, site="login"):
                 flash("登入失敗：密碼錯誤。", "danger")
                 return redirect(url_for("teacher_login"))
 
@@ -279,7 +431,7 @@ def create_app():
                 flash("兩次輸入的密碼不一致。", "warning")
                 return redirect(url_for("teacher_reset", token=token))
 
-            t.password_hash = generate_password_hash(pw1)
+            t.password_hash = generate_password_hash(pw1, site="reset_password")
 
             # ✅ 可選：重設成功後，把年度額度歸零（讓使用者不會被「成功一次就扣一次」卡死）
             # 如果你想保留「每年最多重設 3 次」的嚴格限制，就把這段註解掉。
@@ -296,24 +448,43 @@ def create_app():
     # -------------------------
     # 用戶：儀表板（進行中 / 已結束）
     # -------------------------
+    @lru_cache(maxsize=256)
+    def render_case_tables(teacher_id, data_version):
+        # 表格片段只跟用戶名下案件有關；案件一有異動 data_version 就會變
+        q = (
+            Case.query.filter_by(teacher_id=teacher_id)
+            .options(selectinload(Case.services))  # 表格要列項目，避免逐案 lazy load
+            .order_by(Case.created_at.desc())
+        )
+        active_cases = q.filter_by(status="active").all()
+        closed_cases = q.filter_by(status="closed").all()
+
+        return Markup(render_template(
+            "dashboard_tables.html",
+            active_cases=active_cases,
+            closed_cases=closed_cases,
+            service_label=service_label,
+        ))
+
     @app.get("/teacher/dashboard")
+    @query_budget(6)
     def dashboard():
         guard = require_login()
         if guard:
             return guard
         t = current_teacher()
 
-        q = Case.query.filter_by(teacher_id=t.id).order_by(Case.created_at.desc())
-        active_cases = q.filter_by(status="active").all()
-        closed_cases = q.filter_by(status="closed").all()
-
-        return render_template(
+        resp = make_response(render_template(
             "dashboard.html",
             teacher=t,
-            active_cases=active_cases,
-            closed_cases=closed_cases,
-            service_label=service_label,
-        )
+            case_tables=render_case_tables(t.id, t.data_version or 0),
+        ))
+
+        # 內容沒變就回 304（weak：壓縮後的 body 也視為同一份）
+        resp.add_etag(weak=True)
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+        return resp.make_conditional(request)
 
     # -------------------------
     # 用戶：新增案件（服務對象＋單位＋年度＋項目）
@@ -344,7 +515,7 @@ def create_app():
 
             # 產生查詢碼（只顯示一次）
             code_plain = generate_query_code(8)
-            code_hash = generate_password_hash(code_plain)
+            code_hash = generate_password_hash(code_plain, site="case_new")
             code_enc = encrypt_code(code_plain)
             hint = f"**{code_plain[-2:]}"  # 尾2碼提示（可選）
 
@@ -360,6 +531,7 @@ def create_app():
             )
             db.session.add(c)
             db.session.flush()  # 取得 c.id
+            touch_teacher(t)
 
             def parse_float(name: str):
                 try:
@@ -398,6 +570,7 @@ def create_app():
     # 用戶：案件詳情（新增上課、手動結案、重置查詢碼）
     # -------------------------
     @app.route("/teacher/cases/<int:case_id>", methods=["GET", "POST"])
+    @query_budget(11)
     def case_detail(case_id):
         guard = require_login()
         if guard:
@@ -411,9 +584,14 @@ def create_app():
         # 取服務項目
         services = {s.service_type: s for s in c.services}
 
-        # 計算已用/剩餘
-        used_o = sum(s.hours_orientation for s in c.sessions)
-        used_l = sum(s.hours_life for s in c.sessions)
+        # 計算已用/剩餘（由每月 GROUP BY 合計加總，不逐筆掃 c.sessions）
+        monthly = monthly_usage(c)
+        used = {}
+        for _, hours in monthly:
+            for stype, h in hours.items():
+                used[stype] = used.get(stype, 0.0) + h
+        used_o = used.get("orientation", 0.0)
+        used_l = used.get("life", 0.0)
 
         granted_o = services.get("orientation").granted_hours if "orientation" in services else 0.0
         granted_l = services.get("life").granted_hours if "life" in services else 0.0
@@ -459,6 +637,7 @@ def create_app():
                     start_date=date.fromisoformat(start_date),
                     granted_hours=granted
                 ))
+                touch_case(c)
                 db.session.commit()
                 flash(f"已新增項目：{service_label(service_type)}（核給 {granted} 小時）。", "success")
                 return redirect(url_for("case_detail", case_id=case_id))
@@ -470,11 +649,7 @@ def create_app():
                     return redirect(url_for("case_detail", case_id=case_id))
 
                 # 若已用過時數，不允許刪除（避免對帳亂掉）
-                used_hours = 0.0
-                if service_type == "orientation":
-                    used_hours = sum(s.hours_orientation for s in c.sessions)
-                else:
-                    used_hours = sum(s.hours_life for s in c.sessions)
+                used_hours = used_o if service_type == "orientation" else used_l
 
                 if used_hours > 0:
                     flash("此項目已有上課時數紀錄，不能刪除。若真的要刪，請先將相關上課時數改為 0 或刪除該筆紀錄。",
@@ -482,6 +657,7 @@ def create_app():
                     return redirect(url_for("case_detail", case_id=case_id))
 
                 db.session.delete(services[service_type])
+                touch_case(c)
                 db.session.commit()
                 flash(f"已刪除項目：{service_label(service_type)}。", "info")
                 return redirect(url_for("case_detail", case_id=case_id))
@@ -504,11 +680,7 @@ def create_app():
                     return redirect(url_for("case_detail", case_id=case_id))
 
                 # 已用時數（避免核給改到比已用還小，造成對帳混亂）
-                used_hours = 0.0
-                if service_type == "orientation":
-                    used_hours = sum(s.hours_orientation for s in c.sessions)
-                else:
-                    used_hours = sum(s.hours_life for s in c.sessions)
+                used_hours = used_o if service_type == "orientation" else used_l
 
                 if new_granted < used_hours:
                     flash(f"核給時數不可小於已用時數（已用 {used_hours}）。若要退回，請先確認是否要刪/改上課紀錄。",
@@ -516,6 +688,7 @@ def create_app():
                     return redirect(url_for("case_detail", case_id=case_id))
 
                 services[service_type].granted_hours = new_granted
+                touch_case(c)
                 db.session.commit()
                 flash(f"已更新 {service_label(service_type)} 核給時數為 {new_granted}。", "success")
                 return redirect(url_for("case_detail", case_id=case_id))
@@ -541,11 +714,16 @@ def create_app():
                     flash("請輸入有效時數（至少一項 > 0）。", "danger")
                     return redirect(url_for("case_detail", case_id=case_id))
 
-                db.session.add(Session(
-                    case_id=c.id,
-                    session_date=date.fromisoformat(session_date),
-                    hours_orientation=ho,
-                    hours_life=hl
+                if hours_to_minutes(ho) is None or hours_to_minutes(hl) is None:
+                    flash("時數最小只能到分鐘。", "danger")
+                    return redirect(url_for("case_detail", case_id=case_id))
+
+                seq = touch_case(c)
+                db.session.add(new_session(
+                    c.id,
+                    date.fromisoformat(session_date),
+                    {"orientation": ho, "life": hl},
+                    sync_seq=seq,
                 ))
                 db.session.commit()
                 flash("已新增上課紀錄。", "success")
@@ -560,27 +738,31 @@ def create_app():
                     c.status = "active"
                     c.closed_at = None
                     flash("已恢復為進行中。", "info")
+                touch_case(c)
                 db.session.commit()
                 return redirect(url_for("case_detail", case_id=case_id))
 
             if action == "reset_code":
                 new_code = generate_query_code(8)
-                c.query_code_hash = generate_password_hash(new_code)
+                c.query_code_hash = generate_password_hash(new_code, site="reset_code")
                 c.query_code_enc = encrypt_code(new_code)
                 c.query_code_hint = f"**{new_code[-2:]}"
+                touch_case(c)
                 db.session.commit()
                 flask_session["one_time_code"] = new_code  # 一次性
                 return redirect(url_for("case_detail", case_id=case_id))
 
             if action == "delete_case":
+                db.session.execute(delete(SessionHours).where(SessionHours.case_id == c.id))
                 db.session.delete(c)
+                touch_teacher(t)
                 db.session.commit()
                 flash("案件已刪除。", "info")
                 return redirect(url_for("dashboard"))
 
             if action == "reveal_code":
                 password_confirm = request.form.get("password_confirm") or ""
-                if not check_password_hash(t.password_hash, password_confirm):
+                if not check_password_hash(t.password_hash, password_confirm, site="reveal_code"):
                     flash("密碼錯誤，無法顯示查詢碼。", "danger")
                     return redirect(url_for("case_detail", case_id=case_id))
 
@@ -595,6 +777,16 @@ def create_app():
 
         one_time_code = flask_session.pop("one_time_code", None)
 
+        # 依目前速度推估用完日期
+        run_out_o = run_out_l = None
+        if "orientation" in services:
+            run_out_o = project_run_out(granted_o, used_o, services["orientation"].start_date)
+        if "life" in services:
+            run_out_l = project_run_out(granted_l, used_l, services["life"].start_date)
+
+        # 長條圖以單月最大值為 100%
+        usage_peak = max([max(hours.values()) for _, hours in monthly] or [0]) or 1
+
         return render_template(
             "case_detail.html",
             teacher=t,
@@ -604,6 +796,10 @@ def create_app():
             used_l=used_l,
             remaining_o=remaining_o,
             remaining_l=remaining_l,
+            monthly=monthly,
+            usage_peak=usage_peak,
+            run_out_o=run_out_o,
+            run_out_l=run_out_l,
             service_label=service_label,
             one_time_code=one_time_code,
             today=today,
@@ -613,6 +809,8 @@ def create_app():
     # 用戶：年度匯出 CSV（跨年度用戶自己下載保存）
     # -------------------------
     @app.get("/teacher/export")
+    @read_only
+    @query_budget(6)
     def teacher_export():
         guard = require_login()
         if guard:
@@ -624,61 +822,100 @@ def create_app():
         except:
             year = date.today().year
 
-        cases = Case.query.filter_by(teacher_id=t.id, fiscal_year=year).order_by(Case.student_name.asc()).all()
-
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow([
-            "年度", "用戶", "服務對象", "單位", "狀態",
-            "項目", "開始日", "核給時數",
-            "上課日期", "定向時數", "生活時數",
-        ])
-
-        for c in cases:
-            svc_map = {s.service_type: s for s in c.services}
-            # 逐筆 session 展開；若無 session 也輸出一列案件資訊
-            if c.sessions:
-                for sess in sorted(c.sessions, key=lambda x: x.session_date):
-                    for stype, s in svc_map.items():
-                        # 每列都帶上該項目資訊，方便做行政對帳
-                        writer.writerow([
-                            c.fiscal_year,
-                            t.full_name,
-                            c.student_name,
-                            c.agency_name,
-                            c.status,
-                            service_label(stype),
-                            s.start_date.isoformat(),
-                            s.granted_hours,
-                            sess.session_date.isoformat(),
-                            sess.hours_orientation,
-                            sess.hours_life
-                        ])
-            else:
-                for stype, s in svc_map.items():
-                    writer.writerow([
-                        c.fiscal_year,
-                        t.full_name,
-                        c.student_name,
-                        c.agency_name,
-                        c.status,
-                        service_label(stype),
-                        s.start_date.isoformat(),
-                        s.granted_hours,
-                        "", "", ""
-                    ])
+        cases = (
+            Case.query.filter_by(teacher_id=t.id, fiscal_year=year)
+            .options(selectinload(Case.services), selectinload(Case.sessions))
+            .order_by(Case.student_name.asc())
+            .all()
+        )
+
+        return export_csv(t, cases, year, used=used_hours([c.id for c in cases]))
+
+    # -------------------------
+    # 用戶：封存案件（唯讀瀏覽＋匯出）
+    # -------------------------
+    @app.get("/teacher/archive")
+    @read_only
+    @query_budget(5)
+    def archive_list():
+        guard = require_login()
+        if guard:
+            return guard
+        t = current_teacher()
+
+        year = request.args.get("year", type=int)
+        q = ArchivedCase.query.filter_by(teacher_id=t.id)
+        years = [y for (y,) in q.with_entities(ArchivedCase.fiscal_year).distinct().order_by(ArchivedCase.fiscal_year.desc())]
+        if year is None and years:
+            year = years[0]
+
+        cases = (
+            q.filter_by(fiscal_year=year)
+            .options(selectinload(ArchivedCase.services))
+            .order_by(ArchivedCase.student_name.asc())
+            .all()
+        )
+        return render_template(
+            "archive.html",
+            teacher=t,
+            cases=cases,
+            years=years,
+            year=year,
+            service_label=service_label,
+        )
+
+    @app.get("/teacher/archive/<int:archive_id>")
+    @read_only
+    @query_budget(5)
+    def archive_detail(archive_id):
+        guard = require_login()
+        if guard:
+            return guard
+        t = current_teacher()
+
+        c = ArchivedCase.query.filter_by(id=archive_id, teacher_id=t.id).first_or_404()
+        services = {s.service_type: s for s in c.services}
+        used_o = sum(s.hours_orientation for s in c.sessions)
+        used_l = sum(s.hours_life for s in c.sessions)
+
+        return render_template(
+            "archive_detail.html",
+            teacher=t,
+            case=c,
+            services=services,
+            used_o=used_o,
+            used_l=used_l,
+            service_label=service_label,
+        )
+
+    @app.get("/teacher/archive/export")
+    @read_only
+    @query_budget(5)
+    def archive_export():
+        guard = require_login()
+        if guard:
+            return guard
+        t = current_teacher()
 
-        mem = io.BytesIO()
-        mem.write(output.getvalue().encode("utf-8-sig"))
-        mem.seek(0)
+        try:
+            year = int(request.args.get("year") or date.today().year - 1)
+        except:
+            year = date.today().year - 1
 
-        filename = f"工作時數E指通_{t.full_name}_{year}.csv"
-        return send_file(mem, as_attachment=True, download_name=filename, mimetype="text/csv")
+        cases = (
+            ArchivedCase.query.filter_by(teacher_id=t.id, fiscal_year=year)
+            .options(selectinload(ArchivedCase.services), selectinload(ArchivedCase.sessions))
+            .order_by(ArchivedCase.student_name.asc())
+            .all()
+        )
+        return export_csv(t, cases, year, suffix="_封存")
 
     # -------------------------
     # 單位查詢：單位名稱＋服務對象姓名＋查詢碼
     # -------------------------
     @app.route("/lookup", methods=["GET", "POST"])
+    @read_only
+    @query_budget(4)
     def lookup():
         result = None
         if request.method == "POST":
@@ -701,7 +938,7 @@ def create_app():
             ).all()
             matched = None
             for c in candidates:
-                if check_password_hash(c.query_code_hash, code):
+                if check_password_hash(c.query_code_hash, code, site="lookup"):
                     matched = c
                     break
 
@@ -712,8 +949,9 @@ def create_app():
             services = {s.service_type: s for s in matched.services}
             sessions = sorted(matched.sessions, key=lambda x: x.session_date)
 
-            used_o = sum(s.hours_orientation for s in sessions)
-            used_l = sum(s.hours_life for s in sessions)
+            used = used_hours([matched.id]).get(matched.id, {})
+            used_o = used.get("orientation", 0.0)
+            used_l = used.get("life", 0.0)
 
             granted_o = services.get("orientation").granted_hours if "orientation" in services else 0.0
             granted_l = services.get("life").granted_hours if "life" in services else 0.0
@@ -731,19 +969,128 @@ def create_app():
 
         return render_template("lookup.html", result=result)
 
+    # -------------------------
+    # 單位批次查詢：一次核對多位服務對象，輸出彙總表或 CSV
+    # -------------------------
+    @app.route("/lookup/batch", methods=["GET", "POST"])
+    @read_only
+    @query_budget(4)
+    def lookup_batch():
+        results = None
+        agency_name = ""
+        if request.method == "POST":
+            agency_name = (request.form.get("agency_name") or "").replace("　", "").strip()
+            try:
+                results = verify_batch(agency_name, parse_lines(request.form.get("items")))
+            except BatchLookupError as e:
+                flash(str(e), "danger")
+                return redirect(url_for("lookup_batch"))
+
+            if request.form.get("format") == "csv":
+                return export_batch_csv(agency_name, results)
+
+        return render_template(
+            "lookup_batch.html",
+            results=results,
+            agency_name=agency_name,
+            items_text=request.form.get("items") or "",
+            service_label=service_label,
+        )
+
+    @app.post("/api/lookup/batch")
+    @read_only
+    @query_budget(4)
+    def api_lookup_batch():
+        # {"agency_name": "...", "items": [{"student_name": "...", "code": "..."}, ...]}
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get("items"), list):
+            return jsonify(error="請送出 JSON 物件，items 為陣列。"), 400
+        items = []
+        for it in data["items"]:
+            if not isinstance(it, dict):
+                return jsonify(error="items 每一筆須為物件。"), 400
+            items.append((str(it.get("student_name") or ""), str(it.get("code") or "")))
+
+        try:
+            results = verify_batch(str(data.get("agency_name") or ""), items)
+        except BatchLookupError as e:
+            return jsonify(error=str(e)), 400
+        return jsonify(results=results)
+
+    # -------------------------
+    # API：離線補登（token 驗證，JSON）
+    # 1) POST /api/token 取得 token
+    # 2) POST /api/sync 送一批紀錄（每筆帶 key，重送不會重複）；GET /api/sync?since= 只拿變化
+    # -------------------------
+    def api_teacher():
+        auth = request.headers.get("Authorization") or ""
+        if not auth.startswith("Bearer "):
+            return None
+        try:
+            data = serializer.loads(auth[len("Bearer "):].strip(), salt="api-sync", max_age=API_TOKEN_MAX_AGE)
+            t = db.session.get(Teacher, int(data.get("tid")))
+        except (BadSignature, TypeError, ValueError, AttributeError):
+            return None
+        if not t or not t.is_active:
+            return None
+        return t
+
+    @app.post("/api/token")
+    def api_token():
+        data = request.get_json(silent=True) or {}
+        full_name = str(data.get("full_name") or "").strip()
+        password = str(data.get("password") or "")
+
+        t = Teacher.query.filter_by(full_name=full_name).first() if full_name else None
+        if not t or not t.is_active or not check_password_hash(t.password_hash, password, site="api_token"):
+            return jsonify(error="用戶名稱或密碼錯誤。"), 401
+
+        token = serializer.dumps({"tid": t.id}, salt="api-sync")
+        return jsonify(token=token, expires_in=API_TOKEN_MAX_AGE)
+
+    @app.route("/api/sync", methods=["GET", "POST"])
+    @query_budget(16)
+    def api_sync():
+        t = api_teacher()
+        if not t:
+            return jsonify(error="token 無效或已過期，請重新取得。"), 401
+
+        if request.method == "GET":
+            return jsonify(changes_since(t, request.args.get("since")))
+
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify(error="請送出 JSON 物件。"), 400
+
+        try:
+            results = apply_batch(t, data.get("records"))
+            db.session.commit()
+        except SyncError as e:
+            db.session.rollback()
+            return jsonify(error=str(e)), 400
+        except IntegrityError:
+            # 同一個 key 被兩個請求同時送出：整批退回，重送時會得到 duplicate
+            db.session.rollback()
+            return jsonify(error="有紀錄正在同時寫入，請稍後重送整批。"), 409
+
+        return jsonify(results=results, **changes_since(t, data.get("since")))
+
     # =========================
     # ROUTES END
     # =========================
 
-    with app.app_context():
-        db.create_all()
-
+    # 資料表的建立/升級不在這裡做（每個 worker 都會跑到）：見 migrate.py
     return app
 
 
 app = create_app()
 
 if __name__ == "__main__":
+    from migrate import migrate
+
+    with app.app_context():
+        migrate()
+
     port = int(os.environ.get("PORT", 5000))
     debug = os.environ.get("RAILWAY_ENVIRONMENT") is None  # 本機才開 debug
     app.run(host="0.0.0.0", port=port, debug=debug)
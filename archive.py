@@ -0,0 +1,106 @@
+# archive.py
+# 熱/冷資料分層：把舊案件整批搬進 archive_* 表（INSERT ... SELECT），再從 live 表刪除。
+from datetime import datetime
+
+from sqlalchemy import DateTime, and_, delete, insert, literal, select, update
+
+from models import (
+    db, Teacher, Case, CaseService, Session, SessionHours,
+    ArchivedCase, ArchivedCaseService, ArchivedSession,
+)
+
+CHUNK_SIZE = 500
+
+
+def _archive_chunk(case_ids, stamp) -> None:
+    ac = ArchivedCase
+    # 同一批封存用同一個 archived_at，靠 (orig_id, archived_at) 對回新的 archive_cases.id
+    same_batch = ac.archived_at == literal(stamp, DateTime)
+
+    db.session.execute(
+        insert(ArchivedCase).from_select(
+            ["orig_id", "teacher_id", "student_name", "agency_name", "status",
+             "fiscal_year", "created_at", "closed_at", "archived_at"],
+            select(
+                Case.id, Case.teacher_id, Case.student_name, Case.agency_name, Case.status,
+                Case.fiscal_year, Case.created_at, Case.closed_at, literal(stamp, DateTime),
+            ).where(Case.id.in_(case_ids))
+        )
+    )
+    db.session.execute(
+        insert(ArchivedCaseService).from_select(
+            ["archive_case_id", "service_type", "start_date", "granted_hours"],
+            select(ac.id, CaseService.service_type, CaseService.start_date, CaseService.granted_hours)
+            .join(ac, and_(ac.orig_id == CaseService.case_id, same_batch))
+            .where(CaseService.case_id.in_(case_ids))
+        )
+    )
+    db.session.execute(
+        insert(ArchivedSession).from_select(
+            ["archive_case_id", "session_date", "hours_orientation", "hours_life", "created_at"],
+            select(ac.id, Session.session_date, Session.hours_orientation, Session.hours_life, Session.created_at)
+            .join(ac, and_(ac.orig_id == Session.case_id, same_batch))
+            .where(Session.case_id.in_(case_ids))
+        )
+    )
+
+    # dashboard 片段快取要失效
+    db.session.execute(
+        update(Teacher)
+        .where(Teacher.id.in_(select(Case.teacher_id).where(Case.id.in_(case_ids))))
+        .values(data_version=Teacher.data_version + 1)
+    )
+
+    db.session.execute(delete(SessionHours).where(SessionHours.case_id.in_(case_ids)))
+    db.session.execute(delete(Session).where(Session.case_id.in_(case_ids)))
+    db.session.execute(delete(CaseService).where(CaseService.case_id.in_(case_ids)))
+    db.session.execute(delete(Case).where(Case.id.in_(case_ids)))
+
+
+def archive_cases(case_ids) -> int:
+    """
+    把指定案件（含項目、上課紀錄）搬進封存表。不 commit，由呼叫端決定。
+    呼叫端要先鎖住這些案件（SELECT ... FOR UPDATE），否則兩個 transaction
+    可能同時 INSERT ... SELECT 同一批案件，封存表會多出重複資料。
+    """
+    case_ids = list(case_ids)
+    if not case_ids:
+        return 0
+
+    stamp = datetime.utcnow()
+    for i in range(0, len(case_ids), CHUNK_SIZE):
+        _archive_chunk(case_ids[i:i + CHUNK_SIZE], stamp)
+
+    # bulk 刪除不會同步 ORM 物件，避免之後讀到已刪的案件
+    db.session.expire_all()
+    return len(case_ids)
+
+
+def archive_fiscal_years(up_to_year: int) -> int:
+    """
+    年度結轉：封存 fiscal_year <= up_to_year 的所有案件。
+    自動結轉在每個 worker 的 before_request 都會跑：已被別的 transaction 鎖住的案件直接跳過（SKIP LOCKED），
+    只有一個 transaction 會搬到同一筆。
+    """
+    ids = [
+        cid for (cid,) in
+        db.session.query(Case.id)
+        .filter(Case.fiscal_year <= up_to_year)
+        .with_for_update(skip_locked=True)
+    ]
+    return archive_cases(ids)
+
+
+def archive_closed_before(cutoff: datetime) -> int:
+    """
+    封存結案時間早於 cutoff 的案件。
+    """
+    ids = [
+        cid for (cid,) in
+        db.session.query(Case.id)
+        .filter(Case.status == "closed")
+        .filter(Case.closed_at.isnot(None))
+        .filter(Case.closed_at <= cutoff)
+        .with_for_update(skip_locked=True)
+    ]
+    return archive_cases(ids)
@@ -0,0 +1,163 @@
+# assets.py
+# 靜態檔指紋化（style.css → dist/style.<hash>.css）＋預先壓縮（.gz / .br）
+# 以及動態 HTML / CSV 回應的 gzip / brotli 壓縮。
+#
+# 建置：python assets.py（gunicorn.conf.py 啟動時會自動跑；沒有 manifest 時照常提供原檔，只是不做長效快取）
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import request, send_from_directory
+
+try:
+    import brotli  # 選用套件：沒裝就只用 gzip
+except ImportError:  # pragma: no cover
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST_NAME = "dist"
+DIST_DIR = os.path.join(STATIC_DIR, DIST_NAME)
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+# 這些副檔名值得預先壓縮（圖片等本身已壓縮就略過）
+PRECOMPRESS_EXTS = {".css", ".js", ".svg", ".html", ".txt", ".json"}
+
+COMPRESS_MIMETYPES = {"text/html", "text/csv"}
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "500"))
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", "6"))
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def _encodings():
+    # 伺服器偏好順序：br 比 gzip 小，優先
+    return ["br", "gzip"] if brotli else ["gzip"]
+
+
+def _compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=min(level, 9), mtime=0)
+
+
+def build(static_dir: str = STATIC_DIR) -> dict:
+    """
+    產生指紋檔名、.gz / .br 與 manifest.json，回傳 manifest（原檔名 → dist 內檔名）。
+    """
+    dist_dir = os.path.join(static_dir, DIST_NAME)
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for name in sorted(files):
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, static_dir).replace(os.sep, "/")
+            with open(src, "rb") as f:
+                data = f.read()
+
+            digest = hashlib.sha256(data).hexdigest()[:10]
+            stem, ext = os.path.splitext(rel)
+            hashed = f"{stem}.{digest}{ext}"
+            dst = os.path.join(dist_dir, hashed)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(dst, "wb") as f:
+                f.write(data)
+
+            if ext.lower() in PRECOMPRESS_EXTS:
+                with open(dst + ".gz", "wb") as f:
+                    f.write(_compress(data, "gzip", 9))
+                if brotli:
+                    with open(dst + ".br", "wb") as f:
+                        f.write(_compress(data, "br", 11))
+
+            manifest[rel] = f"{DIST_NAME}/{hashed}"
+
+    tmp = os.path.join(dist_dir, "manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(dist_dir, "manifest.json"))
+    return manifest
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_assets(app):
+    """
+    掛上：url_for('static') 指紋化、預壓縮靜態檔、動態回應壓縮。
+    """
+    manifest = load_manifest(os.path.join(app.static_folder, DIST_NAME, "manifest.json"))
+    fingerprinted = set(manifest.values())
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == "static" and manifest:
+            filename = values.get("filename")
+            if filename in manifest:
+                values["filename"] = manifest[filename]
+
+    def static(filename):
+        if filename not in fingerprinted:
+            return app.send_static_file(filename)
+
+        # 檔名含 hash，內容不會變 → 可長效快取；有預壓縮檔就直接送
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        encoding = request.accept_encodings.best_match(_encodings())
+        path = filename
+        if encoding:
+            candidate = f"{filename}.{'br' if encoding == 'br' else 'gz'}"
+            if os.path.isfile(os.path.join(app.static_folder, candidate)):
+                path = candidate
+            else:
+                encoding = None
+
+        resp = send_from_directory(app.static_folder, path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        resp.vary.add("Accept-Encoding")
+        resp.cache_control.immutable = True
+        return resp
+
+    app.view_functions["static"] = static
+
+    @app.after_request
+    def compress_response(resp):
+        if os.environ.get("DISABLE_COMPRESSION") == "1":
+            return resp
+        if request.endpoint == "static" or resp.mimetype not in COMPRESS_MIMETYPES:
+            return resp
+
+        resp.vary.add("Accept-Encoding")
+        if resp.status_code != 200 or "Content-Encoding" in resp.headers:
+            return resp
+
+        encoding = request.accept_encodings.best_match(_encodings())
+        if not encoding:
+            return resp
+
+        # send_file（CSV 匯出）預設 direct_passthrough，要先關掉才能讀 body
+        resp.direct_passthrough = False
+        data = resp.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return resp
+
+        resp.set_data(_compress(data, encoding, COMPRESS_LEVEL))
+        resp.headers["Content-Encoding"] = encoding
+        return resp
+
+
+if __name__ == "__main__":
+    result = build()
+    print(f"✅ assets built: {len(result)} files -> {DIST_DIR}")
@@ -0,0 +1,123 @@
+# batchlookup.py
+# 單位批次查詢：同一單位一次核對多位服務對象（姓名＋查詢碼）。
+# 候選案件一次查完，查詢碼在 hash pool 裡並行驗證，並受單次請求的 CPU 預算限制。
+import os
+import re
+import time
+
+from sqlalchemy.orm import selectinload
+
+from models import Case
+from hashing import check_many
+from usage import used_hours
+
+LOOKUP_BATCH_MAX_ITEMS = int(os.environ.get("LOOKUP_BATCH_MAX_ITEMS", "50"))
+LOOKUP_BATCH_MAX_CHECKS = int(os.environ.get("LOOKUP_BATCH_MAX_CHECKS", "100"))  # 單次最多驗幾個 hash
+LOOKUP_BATCH_TIMEOUT = float(os.environ.get("LOOKUP_BATCH_TIMEOUT", "10"))  # 秒
+
+
+class BatchLookupError(Exception):
+    """整批無法處理（沒有單位名稱、筆數過多）。"""
+
+
+def clean_name(s: str) -> str:
+    # 與單筆查詢相同：去掉全形空白
+    return (s or "").replace("　", "").strip()
+
+
+def parse_lines(text: str) -> list:
+    """
+    每行一位：「姓名 查詢碼」（空白、逗號或 tab 分隔皆可）。
+    """
+    items = []
+    for line in (text or "").splitlines():
+        parts = [p for p in re.split(r"[\s,，]+", line.replace("　", " ").strip()) if p]
+        if not parts:
+            continue
+        name = parts[0]
+        code = parts[-1] if len(parts) > 1 else ""
+        items.append((name, code))
+    return items
+
+
+def verify_batch(agency_name: str, items: list) -> list:
+    """
+    items: [(student_name, code), ...]，回傳同順序的結果 dict：
+      status = ok / not_found / skipped（超過單次預算，請分批再查）
+    """
+    agency_name = clean_name(agency_name)
+    if not agency_name:
+        raise BatchLookupError("請輸入單位名稱。")
+    if not items:
+        raise BatchLookupError("請至少輸入一位服務對象與查詢碼。")
+    if len(items) > LOOKUP_BATCH_MAX_ITEMS:
+        raise BatchLookupError(f"一次最多查詢 {LOOKUP_BATCH_MAX_ITEMS} 位。")
+
+    items = [(clean_name(name), (code or "").strip().upper()) for name, code in items]
+
+    # 候選案件一次撈齊
+    names = {name for name, code in items if name and code}
+    candidates = {}
+    if names:
+        rows = (
+            Case.query.options(selectinload(Case.services))
+            .filter(Case.student_name.in_(names), Case.agency_name.ilike(f"%{agency_name}%"))
+            .order_by(Case.id.asc())
+            .all()
+        )
+        for c in rows:
+            candidates.setdefault(c.student_name, []).append(c)
+
+    # 要驗證的 (item, case)；超過預算的項目標記 skipped
+    pairs = []
+    owners = []
+    skipped = set()
+    for idx, (name, code) in enumerate(items):
+        cands = candidates.get(name, []) if code else []
+        if len(pairs) + len(cands) > LOOKUP_BATCH_MAX_CHECKS:
+            skipped.add(idx)
+            continue
+        for c in cands:
+            pairs.append((c.query_code_hash, code))
+            owners.append((idx, c))
+
+    deadline = time.time() + LOOKUP_BATCH_TIMEOUT
+    verified = check_many(pairs, site="lookup_batch", deadline=deadline)
+
+    matched = {}
+    for (idx, c), ok in zip(owners, verified):
+        if ok is None:
+            skipped.add(idx)
+        elif ok and idx not in matched:
+            matched[idx] = c
+
+    used = used_hours([c.id for c in matched.values()])
+
+    results = []
+    for idx, (name, code) in enumerate(items):
+        c = matched.get(idx)
+        if c is None:
+            results.append({
+                "student_name": name,
+                "status": "skipped" if idx in skipped else "not_found",
+            })
+            continue
+
+        case_used = used.get(c.id, {})
+        services = {}
+        for s in c.services:
+            u = case_used.get(s.service_type, 0.0)
+            services[s.service_type] = {
+                "granted": s.granted_hours,
+                "used": u,
+                "remaining": s.granted_hours - u,
+            }
+        results.append({
+            "student_name": name,
+            "status": "ok",
+            "agency_name": c.agency_name,
+            "fiscal_year": c.fiscal_year,
+            "case_status": c.status,
+            "services": services,
+        })
+    return results
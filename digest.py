@@ -0,0 +1,122 @@
+# digest.py
+# 每晚排程：找出「剩餘時數偏低」或「依目前速度很快會用完」的進行中案件，
+# 每位用戶彙整成一封提醒信。
+#
+# 用法：python digest.py [--dry-run]
+#   本機測試：MAIL_BACKEND=console python digest.py（只印出信件）
+import os
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import and_, func
+
+from app import create_app
+from models import db, Teacher, Case, CaseService, SessionHours, minutes_to_hours
+from usage import project_run_out
+from utils import service_label
+from mailer import send_batch
+
+DIGEST_REMAINING_HOURS = float(os.environ.get("DIGEST_REMAINING_HOURS", "5"))
+DIGEST_RUNOUT_DAYS = int(os.environ.get("DIGEST_RUNOUT_DAYS", "30"))
+
+
+def find_low_balance(today: date = None) -> dict:
+    """
+    一次聚合查詢（CaseService × SessionHours，以項目分組）取出所有進行中案件的已用時數，
+    回傳 {teacher_id: {"teacher": (姓名, email), "items": [...]}}。
+    """
+    today = today or date.today()
+    used = func.coalesce(func.sum(SessionHours.minutes), 0)
+
+    rows = (
+        db.session.query(
+            Teacher.id, Teacher.full_name, Teacher.email,
+            Case.id, Case.student_name, Case.agency_name,
+            CaseService.service_type, CaseService.granted_hours, CaseService.start_date,
+            used,
+        )
+        .select_from(CaseService)
+        .join(Case, Case.id == CaseService.case_id)
+        .join(Teacher, Teacher.id == Case.teacher_id)
+        .outerjoin(SessionHours, and_(
+            SessionHours.case_id == Case.id,
+            SessionHours.category == CaseService.service_type,
+        ))
+        .filter(Case.status == "active", Teacher.is_active == True)  # noqa
+        .filter(CaseService.granted_hours > 0)
+        .group_by(
+            Teacher.id, Teacher.full_name, Teacher.email,
+            Case.id, Case.student_name, Case.agency_name,
+            CaseService.id, CaseService.service_type, CaseService.granted_hours, CaseService.start_date,
+        )
+        .order_by(Teacher.id, Case.student_name, CaseService.service_type)
+        .all()
+    )
+
+    horizon = today + timedelta(days=DIGEST_RUNOUT_DAYS)
+    digests = {}
+    for tid, name, email, cid, student, agency, stype, granted, start, used_h in rows:
+        used_h = minutes_to_hours(used_h)
+        remaining = granted - used_h
+        run_out = project_run_out(granted, used_h, start, today)
+        if remaining > DIGEST_REMAINING_HOURS and (run_out is None or run_out > horizon):
+            continue
+        d = digests.setdefault(tid, {"teacher": (name, email), "items": []})
+        d["items"].append({
+            "case_id": cid,
+            "student_name": student,
+            "agency_name": agency,
+            "service_type": stype,
+            "granted": granted,
+            "used": used_h,
+            "remaining": remaining,
+            "run_out": run_out,
+        })
+    return digests
+
+
+def render_digest(name: str, items: list) -> tuple:
+    subject = f"工作時數 E 指通：{len(items)} 個項目時數即將用完"
+    lines = [f"{name} 您好：", "", "以下進行中案件的核給時數偏低或即將用完：", ""]
+    for it in items:
+        line = (
+            f"- {it['student_name']}（{it['agency_name']}）{service_label(it['service_type'])}："
+            f"核給 {it['granted']}，已用 {it['used']}，剩餘 {it['remaining']}"
+        )
+        if it["remaining"] <= 0:
+            line += "，已用完"
+        elif it["run_out"]:
+            line += f"，預估 {it['run_out']} 用完"
+        lines.append(line)
+    lines += ["", "如需追加核給時數，請盡早與派案單位聯繫。"]
+    return subject, "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    dry_run = "--dry-run" in argv
+
+    app = create_app()
+    with app.app_context():
+        digests = find_low_balance()
+
+    messages = []
+    for d in digests.values():
+        name, email = d["teacher"]
+        subject, body = render_digest(name, d["items"])
+        messages.append((email, subject, body))
+
+    if dry_run:
+        for to_email, subject, body in messages:
+            print(f"📧 to={to_email} subject={subject}\n{body}\n")
+        print(f"✅ digest dry-run: teachers={len(messages)}")
+        return
+
+    sent, failed = send_batch(messages)
+    for to_email, err in failed:
+        print("❌ digest email FAILED:", to_email, err)
+    print(f"✅ digest done: sent={sent}, failed={len(failed)}")
+
+
+if __name__ == "__main__":
+    main()
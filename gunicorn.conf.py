@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+# gunicorn 會自動讀取啟動目錄下的這個檔（procfile 的 web 指令不用改）。
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def on_starting(server):
+    # master 在 fork worker 之前跑一次資料庫升級；用子行程跑，master 不 import app（不帶著連線池 fork）
+    subprocess.run([sys.executable, os.path.join(BASE_DIR, "migrate.py")], cwd=BASE_DIR, check=True)
+
+    # 靜態檔指紋化＋預壓縮（static/dist 不進 git）。每次啟動都重建，manifest 才不會落後於原檔；
+    # 建不起來（例如唯讀檔案系統）就照常提供原檔
+    from assets import DIST_DIR, build
+
+    try:
+        manifest = build()
+    except OSError as e:
+        server.log.warning("⚠️ assets build failed, serving static files as-is: %s", e)
+    else:
+        server.log.info("✅ assets built: %d files -> %s", len(manifest), DIST_DIR)
@@ -0,0 +1,216 @@
+# hashing.py
+# 密碼 / 查詢碼雜湊改在小型 process pool 裡跑：scrypt 會卡住 GIL，
+# 直接在 gunicorn thread 上算，4 threads 實際上只剩 1 個在動。
+#
+# 佇列有上限：排不到位置就丟 HashPoolBusy（app 回 503 + Retry-After），不讓請求越堆越多。
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug import security
+
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", "2"))  # 0 = 直接在目前 thread 算（本機開發用）
+# 每個 gunicorn worker 同時排隊＋計算的上限：預設＝子程序數＋少量排隊（HASH_BACKLOG）。
+# 要比 gunicorn 的 --threads 小，佇列才真的會滿、多出來的請求才會快速拿到 503
+HASH_BACKLOG = int(os.environ.get("HASH_BACKLOG", "1"))
+HASH_QUEUE_SIZE = int(os.environ.get("HASH_QUEUE_SIZE") or max(HASH_WORKERS, 1) + HASH_BACKLOG)
+HASH_QUEUE_TIMEOUT = float(os.environ.get("HASH_QUEUE_TIMEOUT", "0.2"))  # 等空位最多幾秒
+HASH_RETRY_AFTER = int(os.environ.get("HASH_RETRY_AFTER", "2"))
+
+# werkzeug 格式，例如 "scrypt:32768:8:1"、"pbkdf2:sha256:600000"
+HASH_METHOD = os.environ.get("HASH_METHOD", "scrypt")
+HASH_SALT_LENGTH = int(os.environ.get("HASH_SALT_LENGTH", "16"))
+
+
+class HashPoolBusy(Exception):
+    """雜湊佇列已滿。"""
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(HASH_QUEUE_SIZE, 1))
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _mp_context():
+    # gunicorn worker 已經有好幾個 thread，直接 fork 可能把別的 thread 拿著的鎖一起複製過去而卡死；
+    # 改由單執行緒的 forkserver 產生子程序（預載主程式與這個模組，子程序不必各自重新 import）。
+    # 沒有 forkserver 的平台用 spawn
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["__main__", __name__])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # gunicorn fork 之後每個 worker 要有自己的 pool
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=_mp_context())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _drop_pool(pool) -> None:
+    # 子程序被殺掉（OOM、SIGKILL）後整個 pool 就不能用了；丟掉讓下次重建
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _timed(fn, args):
+    started = time.time()
+    return fn(*args), started
+
+
+def _record(site, wait=0.0, run=0.0, busy=False):
+    with _stats_lock:
+        st = _stats.setdefault(site, {
+            "calls": 0, "busy": 0,
+            "wait_total": 0.0, "wait_max": 0.0,
+            "run_total": 0.0, "run_max": 0.0,
+        })
+        if busy:
+            st["busy"] += 1
+            return
+        st["calls"] += 1
+        st["wait_total"] += wait
+        st["wait_max"] = max(st["wait_max"], wait)
+        st["run_total"] += run
+        st["run_max"] = max(st["run_max"], run)
+
+
+def _run(site, fn, *args):
+    if HASH_WORKERS <= 0:
+        started = time.time()
+        result = fn(*args)
+        _record(site, run=time.time() - started)
+        return result
+
+    if not _slots.acquire(timeout=HASH_QUEUE_TIMEOUT):
+        _record(site, busy=True)
+        raise HashPoolBusy(site)
+    try:
+        for attempt in range(2):
+            pool = _get_pool()
+            submitted = time.time()
+            try:
+                result, started = pool.submit(_timed, fn, args).result()
+            except BrokenProcessPool:
+                _drop_pool(pool)
+                if attempt:
+                    raise
+                continue
+            _record(site, wait=max(started - submitted, 0.0), run=time.time() - started)
+            return result
+    finally:
+        _slots.release()
+
+
+def generate_password_hash(password: str, site: str = "-") -> str:
+    return _run(site, security.generate_password_hash, password, HASH_METHOD, HASH_SALT_LENGTH)
+
+
+def check_password_hash(pwhash: str, password: str, site: str = "-") -> bool:
+    return _run(site, security.check_password_hash, pwhash, password)
+
+
+def check_many(pairs, site: str = "-", deadline: float = None) -> list:
+    """
+    同時驗證多組 (hash, 明碼)，回傳同順序的 True/False。
+    一個請求最多同時佔用 HASH_WORKERS 個名額，不會吃光整個佇列；
+    超過 deadline（time.time()）還沒驗到的回傳 None。
+    """
+    results = [None] * len(pairs)
+    if HASH_WORKERS <= 0:
+        for i, (pwhash, password) in enumerate(pairs):
+            if deadline is not None and time.time() >= deadline:
+                break
+            results[i] = _run(site, security.check_password_hash, pwhash, password)
+        return results
+
+    todo = list(enumerate(pairs))
+    todo.reverse()
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            _check_batch(pool, todo, results, site, deadline)
+            return results
+        except BrokenProcessPool:
+            _drop_pool(pool)
+            if attempt:
+                raise
+            # pool 壞掉時還沒驗完的，換新的 pool 重送一次
+            todo = [(i, pair) for i, pair in enumerate(pairs) if results[i] is None]
+            todo.reverse()
+    return results
+
+
+def _check_batch(pool, todo, results, site, deadline) -> None:
+    inflight = {}  # future -> (index, submitted)
+    try:
+        while todo or inflight:
+            while todo and len(inflight) < HASH_WORKERS and (deadline is None or time.time() < deadline):
+                # 手上已有在跑的就不等空位，先收結果
+                if not _slots.acquire(timeout=0 if inflight else HASH_QUEUE_TIMEOUT):
+                    if not inflight:
+                        _record(site, busy=True)
+                        raise HashPoolBusy(site)
+                    break
+                i, (pwhash, password) = todo.pop()
+                try:
+                    fut = pool.submit(_timed, security.check_password_hash, (pwhash, password))
+                except BrokenProcessPool:
+                    _slots.release()
+                    raise
+                inflight[fut] = (i, time.time())
+
+            if deadline is not None and time.time() >= deadline:
+                todo.clear()
+            if not inflight:
+                break
+
+            done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+            for fut in done:
+                i, submitted = inflight.pop(fut)
+                _slots.release()
+                ok, started = fut.result()
+                _record(site, wait=max(started - submitted, 0.0), run=time.time() - started)
+                results[i] = ok
+    finally:
+        # 例外中斷時，等還在跑的做完再歸還名額
+        for fut in inflight:
+            try:
+                fut.result()
+            except Exception:
+                pass
+            _slots.release()
+
+
+def stats() -> dict:
+    """
+    各呼叫點的次數、被擋次數、平均/最大排隊與計算時間（毫秒）。只統計目前這個 process。
+    """
+    with _stats_lock:
+        out = {}
+        for site, st in _stats.items():
+            n = st["calls"] or 1
+            out[site] = {
+                "calls": st["calls"],
+                "busy": st["busy"],
+                "wait_avg_ms": round(st["wait_total"] / n * 1000, 2),
+                "wait_max_ms": round(st["wait_max"] * 1000, 2),
+                "run_avg_ms": round(st["run_total"] / n * 1000, 2),
+                "run_max_ms": round(st["run_max"] * 1000, 2),
+            }
+        return out
@@ -0,0 +1,377 @@
+# loadtest.py
+# 端到端壓力測試（只用標準函式庫）：
+#   1) 在本機 SQLite 建立測試資料（用戶、案件、上課紀錄）
+#   2) 用 procfile 的 gunicorn 設定啟動 app
+#   3) 多個虛擬用戶依比例混合：用戶登入、dashboard、新增上課、匯出、單位查詢（正確/錯誤查詢碼）
+#   4) 輸出各路由 throughput、p50/p95/p99 延遲與錯誤率
+#
+# 例：python loadtest.py --duration 60 --users 16 --mix "dashboard=5,add_session=2,lookup_ok=2,lookup_bad=1"
+#     python loadtest.py --url http://127.0.0.1:5000 --data /tmp/whe-loadtest-xxx/data.json   # 打已經在跑的 server
+import argparse
+import json
+import math
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date
+from http.cookiejar import CookieJar
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MIX = "login=1,dashboard=4,add_session=2,export=1,lookup_ok=2,lookup_bad=1"
+PASSWORD = "loadtest-pw"
+
+
+# =========================
+# 測試資料
+# =========================
+def seed(db_url: str, teachers: int, cases: int, sessions: int) -> dict:
+    """
+    建立測試資料並回傳明碼資訊（用戶名稱、案件 id、查詢碼），給虛擬用戶使用。
+    """
+    os.environ["DATABASE_URL"] = db_url
+    sys.path.insert(0, BASE_DIR)
+
+    from werkzeug.security import generate_password_hash
+    from app import app
+    from migrate import migrate
+    from models import db, Teacher, Case, CaseService, new_session
+    from utils import encrypt_code, generate_query_code
+    from hashing import HASH_METHOD, HASH_SALT_LENGTH
+
+    def hash_(value):
+        return generate_password_hash(value, HASH_METHOD, HASH_SALT_LENGTH)
+
+    year = date.today().year
+    data = {"year": year, "teachers": []}
+
+    with app.app_context():
+        migrate()
+        pw_hash = hash_(PASSWORD)
+        for i in range(teachers):
+            t = Teacher(full_name=f"loadtest-{i}", email=f"loadtest-{i}@example.com", password_hash=pw_hash)
+            db.session.add(t)
+            db.session.flush()
+
+            info = {"full_name": t.full_name, "cases": []}
+            for j in range(cases):
+                code = generate_query_code(8)
+                c = Case(
+                    teacher_id=t.id,
+                    student_name=f"student-{i}-{j}",
+                    agency_name=f"agency-{j % 5}",
+                    query_code_hash=hash_(code),
+                    query_code_enc=encrypt_code(code),
+                    query_code_hint=f"**{code[-2:]}",
+                    status="active",
+                    fiscal_year=year,
+                )
+                db.session.add(c)
+                db.session.flush()
+                for stype in ("orientation", "life"):
+                    db.session.add(CaseService(
+                        case_id=c.id, service_type=stype,
+                        start_date=date(year, 1, 1), granted_hours=10000.0,
+                    ))
+                for k in range(sessions):
+                    db.session.add(new_session(
+                        c.id,
+                        date(year, 1 + k % 12, 1 + k % 28),
+                        {"orientation": 1.0, "life": 0.5},
+                    ))
+                info["cases"].append({
+                    "id": c.id, "student_name": c.student_name,
+                    "agency_name": c.agency_name, "code": code,
+                })
+            data["teachers"].append(info)
+        db.session.commit()
+    return data
+
+
+# =========================
+# 啟動 gunicorn（沿用 procfile 的參數）
+# =========================
+def procfile_command(port: int) -> list:
+    with open(os.path.join(BASE_DIR, "procfile"), encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("web:"):
+                cmd = line[len("web:"):].strip().replace("$PORT", str(port))
+                return shlex.split(cmd)
+    raise RuntimeError("procfile 裡找不到 web: 指令")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def boot(db_url: str, port: int, log_path: str) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=db_url, PORT=str(port))
+    log = open(log_path, "wb")
+    proc = subprocess.Popen(procfile_command(port), cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    url = f"http://127.0.0.1:{port}/"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn 啟動失敗，請看 {log_path}")
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return proc
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"gunicorn 30 秒內沒有回應，請看 {log_path}")
+
+
+# =========================
+# 虛擬用戶
+# =========================
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # 只量測該路由本身；302 視為正常回應
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+
+    def add(self, route, seconds, status, ok):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            self.statuses.setdefault(route, {}).setdefault(status, 0)
+            self.statuses[route][status] += 1
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class VirtualUser:
+    def __init__(self, base_url, data, stats, rng):
+        self.base_url = base_url.rstrip("/")
+        self.data = data
+        self.stats = stats
+        self.rng = rng
+        self.teacher = rng.choice(data["teachers"])
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect()
+        )
+
+    def request(self, route, method, path, form=None, expect=(200,)):
+        body = urllib.parse.urlencode(form).encode() if form is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        req.add_header("Accept-Encoding", "gzip")
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                resp.read()
+                status = resp.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except (urllib.error.URLError, OSError):
+            status = 0
+        self.stats.add(route, time.perf_counter() - started, status, status in expect)
+        return status
+
+    # ---- 各動作 ----
+    def login(self):
+        self.request("login", "POST", "/teacher/login", {
+            "full_name": self.teacher["full_name"], "password": PASSWORD, "action": "login",
+        }, expect=(302,))
+
+    def dashboard(self):
+        self.request("dashboard", "GET", "/teacher/dashboard")
+
+    def add_session(self):
+        c = self.rng.choice(self.teacher["cases"])
+        self.request("add_session", "POST", f"/teacher/cases/{c['id']}", {
+            "action": "add_session",
+            "session_date": date.today().isoformat(),
+            "hours_orientation": "0.5", "hours_life": "0",
+        }, expect=(302,))
+
+    def export(self):
+        self.request("export", "GET", f"/teacher/export?year={self.data['year']}")
+
+    def lookup_ok(self):
+        c = self.rng.choice(self.rng.choice(self.data["teachers"])["cases"])
+        self.request("lookup_ok", "POST", "/lookup", {
+            "agency_name": c["agency_name"], "student_name": c["student_name"], "code": c["code"],
+        })
+
+    def lookup_bad(self):
+        c = self.rng.choice(self.rng.choice(self.data["teachers"])["cases"])
+        # 查詢失敗會 302 回查詢頁
+        self.request("lookup_bad", "POST", "/lookup", {
+            "agency_name": c["agency_name"], "student_name": c["student_name"], "code": "WRONG234",
+        }, expect=(302,))
+
+
+ACTIONS = ("login", "dashboard", "add_session", "export", "lookup_ok", "lookup_bad")
+
+
+def parse_mix(raw: str) -> list:
+    weights = []
+    for part in raw.split(","):
+        if not part.strip():
+            continue
+        name, _, w = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise SystemExit(f"未知的動作：{name}（可用：{', '.join(ACTIONS)}）")
+        weights.append((name, float(w or 1)))
+    return weights
+
+
+def run(base_url, data, mix, users, duration, seed_value=None) -> tuple:
+    stats = Stats()
+    names = [n for n, _ in mix]
+    weights = [w for _, w in mix]
+    stop_at = time.time() + duration
+
+    def worker(idx):
+        rng = random.Random(None if seed_value is None else seed_value + idx)
+        vu = VirtualUser(base_url, data, stats, rng)
+        vu.login()
+        while time.time() < stop_at:
+            getattr(vu, rng.choices(names, weights)[0])()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(users)]
+    started = time.time()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return stats, time.time() - started
+
+
+# =========================
+# 報表
+# =========================
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(stats: Stats, elapsed: float) -> dict:
+    routes = {}
+    total = 0
+    total_err = 0
+    for route, values in sorted(stats.latencies.items()):
+        values = sorted(values)
+        n = len(values)
+        err = stats.errors.get(route, 0)
+        total += n
+        total_err += err
+        routes[route] = {
+            "count": n,
+            "rps": round(n / elapsed, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "error_rate": round(err / n, 4) if n else 0.0,
+            "statuses": {str(k): v for k, v in sorted(stats.statuses[route].items())},
+        }
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(total_err / total, 4) if total else 0.0,
+        "routes": routes,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n總計 {report['requests']} 個請求，{report['elapsed_s']} 秒，"
+          f"{report['rps']} req/s，錯誤率 {report['error_rate'] * 100:.2f}%")
+    header = f"{'route':<12}{'count':>8}{'req/s':>9}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'err%':>8}  statuses"
+    print(header)
+    print("-" * len(header))
+    for route, r in report["routes"].items():
+        print(f"{route:<12}{r['count']:>8}{r['rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+              f"{r['error_rate'] * 100:>7.2f}%  {r['statuses']}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="工作時數E指通 端到端壓力測試")
+    ap.add_argument("--url", help="打現有的 server（不啟動 gunicorn）")
+    ap.add_argument("--duration", type=float, default=30, help="秒")
+    ap.add_argument("--users", type=int, default=8, help="同時虛擬用戶數")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"動作比例（預設 {DEFAULT_MIX}）")
+    ap.add_argument("--teachers", type=int, default=10)
+    ap.add_argument("--cases", type=int, default=5, help="每位用戶的案件數")
+    ap.add_argument("--sessions", type=int, default=40, help="每個案件的上課紀錄數")
+    ap.add_argument("--workdir", help="SQLite 與 log 放這裡（預設暫存資料夾）")
+    ap.add_argument("--data", help="--url 模式：seed 時輸出的 JSON（用戶名稱/查詢碼）")
+    ap.add_argument("--seed", type=int, help="亂數種子（可重現）")
+    ap.add_argument("--json", help="報表另存 JSON（方便比較前後版本）")
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="whe-loadtest-")
+    os.makedirs(workdir, exist_ok=True)
+
+    # 沒給 Fernet key 就產生一把（只用在這次測試）
+    if not os.environ.get("QUERY_CODE_KEY"):
+        from cryptography.fernet import Fernet
+        os.environ["QUERY_CODE_KEY"] = Fernet.generate_key().decode()
+
+    proc = None
+    try:
+        if args.url:
+            if not args.data:
+                raise SystemExit("--url 模式需要 --data（先不加 --url 跑一次，會輸出 data.json）")
+            with open(args.data, encoding="utf-8") as f:
+                data = json.load(f)
+            base_url = args.url
+        else:
+            db_path = os.path.join(workdir, "loadtest.db")
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            db_url = f"sqlite:///{db_path}"
+
+            print(f"🌱 seeding {args.teachers} teachers × {args.cases} cases × {args.sessions} sessions …")
+            data = seed(db_url, args.teachers, args.cases, args.sessions)
+            with open(os.path.join(workdir, "data.json"), "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+
+            port = free_port()
+            print(f"🚀 gunicorn on :{port}（log: {os.path.join(workdir, 'gunicorn.log')}）")
+            proc = boot(db_url, port, os.path.join(workdir, "gunicorn.log"))
+            base_url = f"http://127.0.0.1:{port}"
+
+        print(f"🏃 {args.users} users × {args.duration}s, mix={args.mix}")
+        stats, elapsed = run(base_url, data, mix, args.users, args.duration, args.seed)
+        report = summarize(stats, elapsed)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
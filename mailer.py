@@ -8,13 +8,20 @@ MAIL_FROM = os.environ.get("MAIL_FROM")
 import os
 import requests
 
-def send_reset_email(to_email: str, subject: str, body: str) -> None:
+# 本機測試可指向自己的 mail stub（例如 http://127.0.0.1:8025/v3/mail/send）
+SENDGRID_API_URL = os.environ.get("SENDGRID_API_URL", "https://api.sendgrid.com/v3/mail/send")
+
+
+def _config():
     api_key = (os.environ.get("SENDGRID_API_KEY") or "").strip()
     mail_from = (os.environ.get("MAIL_FROM") or "").strip()
 
     if not api_key or not mail_from:
         raise RuntimeError("Missing SENDGRID_API_KEY or MAIL_FROM")
+    return api_key, mail_from
 
+
+def _send(http, api_key: str, mail_from: str, to_email: str, subject: str, body: str) -> None:
     payload = {
         "personalizations": [{"to": [{"email": to_email}]}],
         "from": {"email": mail_from},
@@ -22,8 +29,8 @@ def send_reset_email(to_email: str, subject: str, body: str) -> None:
         "content": [{"type": "text/plain", "value": body}],
     }
 
-    r = requests.post(
-        "https://api.sendgrid.com/v3/mail/send",
+    r = http.post(
+        SENDGRID_API_URL,
         headers={
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
@@ -35,3 +42,32 @@ def send_reset_email(to_email: str, subject: str, body: str) -> None:
     if r.status_code >= 400:
         raise RuntimeError(f"SendGrid error {r.status_code}: {r.text[:200]}")
 
+
+def send_reset_email(to_email: str, subject: str, body: str) -> None:
+    api_key, mail_from = _config()
+    _send(requests, api_key, mail_from, to_email, subject, body)
+
+
+def send_batch(messages) -> tuple:
+    """
+    一次寄多封信（共用同一條 HTTP 連線）。messages: [(to_email, subject, body), ...]
+    單封失敗不影響其他封，回傳 (成功數, [(to_email, 錯誤), ...])。
+
+    MAIL_BACKEND=console 時只印出，不真的寄（本機/測試用）。
+    """
+    if os.environ.get("MAIL_BACKEND") == "console":
+        for to_email, subject, body in messages:
+            print(f"📧 to={to_email} subject={subject}\n{body}\n")
+        return len(messages), []
+
+    api_key, mail_from = _config()
+    sent = 0
+    failed = []
+    with requests.Session() as http:
+        for to_email, subject, body in messages:
+            try:
+                _send(http, api_key, mail_from, to_email, subject, body)
+                sent += 1
+            except Exception as e:
+                failed.append((to_email, repr(e)))
+    return sent, failed
@@ -0,0 +1,42 @@
+# migrate.py
+# 資料庫結構升級（建新表、補欄位/索引、搬舊資料）。
+# 不在 gunicorn worker 啟動時跑（多個 worker 同時 inspect → ALTER 會互撞），
+# 而是部署時跑一次：gunicorn.conf.py 的 on_starting 會在 master fork worker 之前呼叫，也可以手動
+#   python migrate.py
+import sys
+
+from sqlalchemy import text
+
+from models import db, upgrade_schema
+
+# PostgreSQL advisory lock 的 key：多台機器同時部署時，同一時間只有一個在升級
+MIGRATE_LOCK_KEY = 0x57484501
+
+
+def migrate() -> None:
+    """
+    在 app context 裡呼叫。只處理主庫（replica 的結構跟著主庫複寫）。
+    """
+    with db.engine.connect() as lock_conn:
+        locked = lock_conn.dialect.name == "postgresql"
+        if locked:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATE_LOCK_KEY})
+        try:
+            db.create_all(bind_key=None)
+            upgrade_schema()
+        finally:
+            if locked:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATE_LOCK_KEY})
+
+
+def main() -> int:
+    from app import app
+
+    with app.app_context():
+        migrate()
+    print("✅ database schema up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
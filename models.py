@@ -1,7 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, exists, insert, inspect, literal, select, text, update
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime, date
+import math
 
-db = SQLAlchemy()
+from replica import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class Teacher(db.Model):
     __tablename__ = "teachers"
@@ -18,6 +23,9 @@ class Teacher(db.Model):
     last_login_at = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
 
+    # 名下案件有任何異動就 +1，dashboard 表格片段快取以此為 key
+    data_version = db.Column(db.Integer, default=0, nullable=False)
+
     cases = db.relationship("Case", backref="teacher", cascade="all, delete-orphan")
 
 class Case(db.Model):
@@ -41,6 +49,9 @@ class Case(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     closed_at = db.Column(db.DateTime, nullable=True)
 
+    # 上課/項目有異動就 +1，統計快取以 (case_id, version) 為 key
+    version = db.Column(db.Integer, default=0, nullable=False)
+
     services = db.relationship("CaseService", backref="case", cascade="all, delete-orphan")
     sessions = db.relationship("Session", backref="case", cascade="all, delete-orphan", order_by="Session.session_date.desc()")
 
@@ -66,4 +77,256 @@ class Session(db.Model):
     hours_orientation = db.Column(db.Float, nullable=False, default=0.0)
     hours_life = db.Column(db.Float, nullable=False, default=0.0)
 
+    # 離線補登 API：用戶端產生的冪等鍵，重送不會重複新增（網頁表單新增的為 NULL）
+    client_key = db.Column(db.String(64), nullable=True, unique=True, index=True)
+
+    # 同步用的變更序號：新增時用戶的 data_version（見 touch_teacher），依 commit 順序遞增
+    sync_seq = db.Column(db.Integer, nullable=True, index=True)
+
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # 刪除上課紀錄時由資料庫（或呼叫端整批）刪 session_hours，不逐筆載入
+    hours = db.relationship("SessionHours", backref="session", cascade="all, delete-orphan", passive_deletes=True)
+
+
+# =========================
+# 每次上課各項目時數（正規化）：一個項目一列，時數以分鐘存整數。
+# 合計一律查這張表（索引涵蓋 case/category/date/minutes，不必回表），
+# 之後新增工作項目不用再加欄位。sessions 上的 hours_* 欄位保留給明細顯示與 API。
+# =========================
+MINUTES_PER_HOUR = 60
+
+# 舊的寬欄位 ↔ 項目
+LEGACY_HOURS_COLUMNS = {
+    "orientation": "hours_orientation",
+    "life": "hours_life",
+}
+
+class SessionHours(db.Model):
+    __tablename__ = "session_hours"
+    __table_args__ = (
+        db.UniqueConstraint("session_id", "category", name="uq_session_hours_session_category"),
+        db.Index("ix_session_hours_case_category_date", "case_id", "category", "session_date", "minutes"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+
+    # 以下兩欄與 sessions 重複，為了讓合計只走索引
+    case_id = db.Column(db.Integer, db.ForeignKey("cases.id"), nullable=False)
+    session_date = db.Column(db.Date, nullable=False)
+
+    category = db.Column(db.String(20), nullable=False)  # 同 CaseService.service_type
+    minutes = db.Column(db.Integer, nullable=False)
+
+
+def hours_to_minutes(hours: float):
+    """
+    時數轉分鐘；不是整數分鐘（例如 0.333）或不是有限數字（nan、inf）回傳 None，不偷偷四捨五入。
+    """
+    if not math.isfinite(hours):
+        return None
+    minutes = hours * MINUTES_PER_HOUR
+    if abs(minutes - round(minutes)) > 1e-6:
+        return None
+    return int(round(minutes))
+
+
+def minutes_to_hours(minutes) -> float:
+    return (minutes or 0) / MINUTES_PER_HOUR
+
+
+def session_hours_rows(session_id, case_id, session_date, hours: dict) -> list:
+    """
+    {category: 時數} → session_hours 的列（0 不存）。
+    """
+    return [
+        {
+            "session_id": session_id,
+            "case_id": case_id,
+            "session_date": session_date,
+            "category": category,
+            "minutes": hours_to_minutes(h),
+        }
+        for category, h in hours.items()
+        if h
+    ]
+
+
+def legacy_hours(sess) -> dict:
+    return {category: getattr(sess, col) for category, col in LEGACY_HOURS_COLUMNS.items()}
+
+
+def new_session(case_id, session_date, hours: dict, **kwargs) -> Session:
+    """
+    新增一筆上課紀錄：hours_* 欄位與 session_hours 一起寫（一般 ORM 新增用）。
+    """
+    columns = {col: hours.get(category, 0.0) for category, col in LEGACY_HOURS_COLUMNS.items()}
+    sess = Session(case_id=case_id, session_date=session_date, **columns, **kwargs)
+    sess.hours = [
+        SessionHours(case_id=case_id, session_date=session_date, category=category, minutes=hours_to_minutes(h))
+        for category, h in hours.items()
+        if h
+    ]
+    return sess
+
+
+# =========================
+# 封存（冷資料）：跨年度或結案超過保留期的案件整批搬到這裡，live 表保持精簡。
+# 只讀；不保存查詢碼（封存案件不開放單位查詢）。
+# =========================
+class ArchivedCase(db.Model):
+    __tablename__ = "archive_cases"
+    id = db.Column(db.Integer, primary_key=True)
+    orig_id = db.Column(db.Integer, nullable=False, index=True)  # 原 cases.id
+
+    teacher_id = db.Column(db.Integer, db.ForeignKey("teachers.id"), nullable=False, index=True)
+
+    student_name = db.Column(db.String(80), nullable=False)
+    agency_name = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    fiscal_year = db.Column(db.Integer, nullable=False, index=True)
+
+    created_at = db.Column(db.DateTime, nullable=False)
+    closed_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    services = db.relationship("ArchivedCaseService", backref="case", cascade="all, delete-orphan")
+    sessions = db.relationship("ArchivedSession", backref="case", cascade="all, delete-orphan", order_by="ArchivedSession.session_date.desc()")
+
+class ArchivedCaseService(db.Model):
+    __tablename__ = "archive_case_services"
+    id = db.Column(db.Integer, primary_key=True)
+    archive_case_id = db.Column(db.Integer, db.ForeignKey("archive_cases.id"), nullable=False, index=True)
+
+    service_type = db.Column(db.String(20), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    granted_hours = db.Column(db.Float, nullable=False, default=0.0)
+
+class ArchivedSession(db.Model):
+    __tablename__ = "archive_sessions"
+    id = db.Column(db.Integer, primary_key=True)
+    archive_case_id = db.Column(db.Integer, db.ForeignKey("archive_cases.id"), nullable=False, index=True)
+
+    session_date = db.Column(db.Date, nullable=False)
+    hours_orientation = db.Column(db.Float, nullable=False, default=0.0)
+    hours_life = db.Column(db.Float, nullable=False, default=0.0)
+
+    created_at = db.Column(db.DateTime, nullable=False)
+
+
+def touch_teacher(t: Teacher) -> int:
+    """
+    用戶名下案件有新增/刪除/異動時呼叫：資料版本 +1，讓 dashboard 片段快取失效。
+    立即在資料庫端 +1 並取回新值：該用戶列會鎖到 commit 為止，
+    所以同一用戶的版本號不會重複，而且順序就是 commit 順序（離線同步的 cursor 靠這點）。
+    """
+    new_version = db.session.execute(
+        update(Teacher)
+        .where(Teacher.id == t.id)
+        .values(data_version=Teacher.data_version + 1)
+        .returning(Teacher.data_version)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+    set_committed_value(t, "data_version", new_version)
+    return new_version
+
+
+def touch_case(c: Case):
+    """
+    案件有異動時呼叫：版本號 +1，讓以版本為 key 的快取自動失效（連帶用戶版本）。
+    在資料庫端 +1（UPDATE ... SET version = version + 1）：兩個請求同時寫同一案件也不會撞號，
+    否則快取會以新版本號存到少一筆的統計。
+    """
+    c.version = Case.version + 1
+    if c.teacher is not None:
+        return touch_teacher(c.teacher)
+    return None
+
+
+# create_all 只會建新表，不會幫舊表補欄位；後來新增的欄位登記在這裡。
+# (table, column, DDL)
+ADDED_COLUMNS = [
+    ("cases", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("teachers", "data_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("sessions", "client_key", "VARCHAR(64)"),
+    ("sessions", "sync_seq", "INTEGER"),
+]
+
+# (index, table, column, unique)
+ADDED_INDEXES = [
+    ("ix_sessions_client_key", "sessions", "client_key", True),
+    ("ix_sessions_sync_seq", "sessions", "sync_seq", False),
+]
+
+
+def _inexact_minutes(hours):
+    # 不是整數分鐘的舊資料（SQLite / PostgreSQL 都有 round(x)、abs(x)）
+    minutes = hours * MINUTES_PER_HOUR
+    return db.func.abs(minutes - db.func.round(minutes)) > 1e-6
+
+
+def backfill_session_hours() -> int:
+    """
+    把 sessions.hours_* 整批搬進 session_hours（INSERT ... SELECT，每個項目一條 SQL）。
+    已經搬過的不會重複。不是整數分鐘的舊資料存成最接近的分鐘（不足 0.5 分鐘的不搬），
+    並印出這些 session id 供人工核對；不會因此擋住升級。
+    """
+    inexact = set()
+    for col in LEGACY_HOURS_COLUMNS.values():
+        hours = getattr(Session, col)
+        inexact.update(sid for (sid,) in db.session.query(Session.id).filter(hours > 0, _inexact_minutes(hours)))
+    if inexact:
+        ids = ", ".join(str(sid) for sid in sorted(inexact))
+        print(
+            f"⚠️ sessions 有 {len(inexact)} 筆時數不是整數分鐘，session_hours 已存成最接近的分鐘，"
+            f"請核對 hours_orientation / hours_life：session id {ids}"
+        )
+
+    total = 0
+    for category, col in LEGACY_HOURS_COLUMNS.items():
+        hours = getattr(Session, col)
+        minutes = db.cast(db.func.round(hours * MINUTES_PER_HOUR), db.Integer)
+        already = exists().where(and_(
+            SessionHours.session_id == Session.id,
+            SessionHours.category == category,
+        ))
+        result = db.session.execute(
+            insert(SessionHours).from_select(
+                ["session_id", "case_id", "session_date", "category", "minutes"],
+                select(
+                    Session.id, Session.case_id, Session.session_date, literal(category), minutes,
+                ).where(hours > 0, minutes > 0, ~already)
+            )
+        )
+        total += result.rowcount or 0
+    return total
+
+
+def upgrade_schema() -> None:
+    """
+    補上舊資料庫缺少的欄位（只加不改，SQLite / PostgreSQL 皆可）。
+    """
+    insp = inspect(db.engine)
+    tables = set(insp.get_table_names())
+    for table, column, ddl in ADDED_COLUMNS:
+        if table not in tables:
+            continue
+        existing = {col["name"] for col in insp.get_columns(table)}
+        if column not in existing:
+            db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+    for name, table, column, unique in ADDED_INDEXES:
+        if table not in tables:
+            continue
+        existing = {ix["name"] for ix in insp.get_indexes(table)}
+        if name not in existing:
+            kind = "UNIQUE INDEX" if unique else "INDEX"
+            db.session.execute(text(f"CREATE {kind} {name} ON {table} ({column})"))
+
+    # session_hours 剛建好（舊資料庫）：從 hours_* 欄位搬一次
+    has_sessions = db.session.execute(select(Session.id).limit(1)).first()
+    has_hours = db.session.execute(select(SessionHours.id).limit(1)).first()
+    if has_sessions and not has_hours:
+        moved = backfill_session_hours()
+        print(f"✅ session_hours backfilled: {moved} rows")
+    db.session.commit()
@@ -0,0 +1,243 @@
+# profiling.py
+# 選配的請求效能剖析（環境變數開啟；沒開就完全不包 wsgi_app，零額外成本）：
+#   PROFILE_SAMPLE_RATE=0.01  隨機 1% 的請求用 cProfile 完整剖析
+#   PROFILE_SLOW_MS=800       所有請求掛上低成本的堆疊取樣，只保存超過 800ms 的
+#   PROFILE_DIR               輸出資料夾（預設 <tmp>/whe-profiles），只保留最新 PROFILE_KEEP 份
+#   PROFILE_INTERVAL_MS=5     堆疊取樣間隔
+#
+# 彙整：python profiling.py summarize [DIR] [--top 20]
+import cProfile
+import collections
+import json
+import os
+import pstats
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from querybudget import count_queries
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "whe-profiles")
+
+
+class _StackSampler(threading.Thread):
+    """
+    背景執行緒：每隔 interval 看一次登記中的請求執行緒在跑哪裡（統計式取樣）。
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.active = {}  # thread ident -> Counter(collapsed stack)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.active:
+                continue
+            frames = sys._current_frames()
+            for ident, counts in list(self.active.items()):
+                f = frames.get(ident)
+                if f is not None:
+                    counts[_collapse(f)] += 1
+
+
+def _collapse(frame, limit: int = 60) -> str:
+    # flamegraph 格式：外層;...;內層
+    parts = []
+    while frame is not None and len(parts) < limit:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class ProfilerMiddleware:
+    def __init__(self, wsgi_app, flask_app, profile_dir, sample_rate, slow_ms, keep, interval_ms):
+        self.wsgi_app = wsgi_app
+        self.flask_app = flask_app
+        self.profile_dir = profile_dir
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.keep = keep
+        self.seq = 0
+        self.lock = threading.Lock()
+        # cProfile 同時只能有一個在跑（3.12+ 是全域的），搶不到就這次不剖析
+        self.cprofile_lock = threading.Lock()
+        self.sampler = None
+        if slow_ms > 0:
+            self.sampler = _StackSampler(interval_ms / 1000)
+            self.sampler.start()
+        os.makedirs(profile_dir, exist_ok=True)
+
+    def __call__(self, environ, start_response):
+        prof = None
+        if self.sample_rate > 0 and random.random() < self.sample_rate and self.cprofile_lock.acquire(blocking=False):
+            prof = cProfile.Profile()
+
+        ident = threading.get_ident()
+        stacks = None
+        if self.sampler is not None:
+            stacks = collections.Counter()
+            self.sampler.active[ident] = stacks
+
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            with count_queries() as q:
+                if prof is not None:
+                    prof.enable()
+                try:
+                    return self.wsgi_app(environ, start_response)
+                finally:
+                    if prof is not None:
+                        prof.disable()
+        finally:
+            wall_ms = (time.perf_counter() - started) * 1000
+            cpu_ms = (time.thread_time() - cpu_started) * 1000
+            if stacks is not None:
+                self.sampler.active.pop(ident, None)
+            if prof is not None:
+                self.cprofile_lock.release()
+
+            slow = self.slow_ms > 0 and wall_ms >= self.slow_ms
+            if prof is not None or slow:
+                try:
+                    self._write(environ, wall_ms, cpu_ms, q, prof, stacks if slow else None)
+                except Exception as e:  # 剖析失敗不能影響請求
+                    print("⚠️ profile write failed:", repr(e))
+
+    def _endpoint(self, environ):
+        try:
+            endpoint, _ = self.flask_app.url_map.bind_to_environ(environ).match()
+            return endpoint
+        except Exception:
+            return "-"
+
+    def _write(self, environ, wall_ms, cpu_ms, q, prof, stacks):
+        with self.lock:
+            self.seq += 1
+            seq = self.seq
+        endpoint = self._endpoint(environ)
+        stem = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{os.getpid()}-{seq:06d}-{endpoint}"
+        base = os.path.join(self.profile_dir, stem)
+
+        meta = {
+            "endpoint": endpoint,
+            "method": environ.get("REQUEST_METHOD"),
+            "path": environ.get("PATH_INFO"),
+            "wall_ms": round(wall_ms, 2),
+            "cpu_ms": round(cpu_ms, 2),
+            "queries": q.count,
+            "query_ms": round(q.seconds * 1000, 2),
+            "mode": "cprofile" if prof is not None else "sampler",
+        }
+        if prof is not None:
+            prof.dump_stats(base + ".prof")
+        if stacks:
+            meta["stacks"] = dict(stacks.most_common())
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        self._rotate()
+
+    def _rotate(self):
+        metas = sorted(n for n in os.listdir(self.profile_dir) if n.endswith(".json"))
+        for name in metas[:max(len(metas) - self.keep, 0)]:
+            stem = os.path.join(self.profile_dir, name[:-len(".json")])
+            for ext in (".json", ".prof"):
+                try:
+                    os.remove(stem + ext)
+                except FileNotFoundError:
+                    pass
+
+
+def init_profiling(app):
+    sample_rate = float(os.environ.get("PROFILE_SAMPLE_RATE") or 0)
+    slow_ms = float(os.environ.get("PROFILE_SLOW_MS") or 0)
+    if sample_rate <= 0 and slow_ms <= 0:
+        return
+
+    app.wsgi_app = ProfilerMiddleware(
+        app.wsgi_app,
+        app,
+        profile_dir=PROFILE_DIR,
+        sample_rate=sample_rate,
+        slow_ms=slow_ms,
+        keep=int(os.environ.get("PROFILE_KEEP", "200")),
+        interval_ms=float(os.environ.get("PROFILE_INTERVAL_MS", "5")),
+    )
+
+
+# =========================
+# CLI：彙整剖析檔
+# =========================
+def summarize(profile_dir: str, top: int = 20) -> None:
+    names = sorted(n for n in os.listdir(profile_dir) if n.endswith(".json"))
+    if not names:
+        print(f"（{profile_dir} 沒有剖析檔）")
+        return
+
+    by_route = collections.defaultdict(list)
+    self_samples = collections.Counter()
+    incl_samples = collections.Counter()
+    prof_files = []
+    for name in names:
+        path = os.path.join(profile_dir, name)
+        with open(path, encoding="utf-8") as f:
+            meta = json.load(f)
+        by_route[f"{meta['method']} {meta['endpoint']}"].append(meta)
+        for stack, n in (meta.get("stacks") or {}).items():
+            frames = stack.split(";")
+            self_samples[frames[-1]] += n
+            for fr in set(frames):
+                incl_samples[fr] += n
+        if os.path.exists(path[:-len(".json")] + ".prof"):
+            prof_files.append(path[:-len(".json")] + ".prof")
+
+    print(f"📁 {profile_dir}：{len(names)} 份")
+    header = f"{'route':<32}{'n':>5}{'avg ms':>10}{'p95 ms':>10}{'max ms':>10}{'cpu ms':>10}{'queries':>9}{'sql ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for route, metas in sorted(by_route.items(), key=lambda kv: -sum(m["wall_ms"] for m in kv[1])):
+        walls = sorted(m["wall_ms"] for m in metas)
+        n = len(metas)
+        p95 = walls[max(0, -(-95 * n // 100) - 1)]
+        print(f"{route:<32}{n:>5}{sum(walls) / n:>10.1f}{p95:>10.1f}{walls[-1]:>10.1f}"
+              f"{sum(m['cpu_ms'] for m in metas) / n:>10.1f}"
+              f"{sum(m['queries'] for m in metas) / n:>9.1f}"
+              f"{sum(m['query_ms'] for m in metas) / n:>9.1f}")
+
+    if self_samples:
+        total = sum(self_samples.values())
+        print(f"\n🔥 堆疊取樣（慢請求，共 {total} 個樣本）— self / inclusive")
+        for fr, n in self_samples.most_common(top):
+            print(f"  {n / total * 100:5.1f}%  {fr}")
+        print("  --- inclusive ---")
+        for fr, n in incl_samples.most_common(top):
+            print(f"  {n / total * 100:5.1f}%  {fr}")
+
+    if prof_files:
+        print(f"\n🧮 cProfile（{len(prof_files)} 份合併，依 cumulative 排序）")
+        pstats.Stats(*prof_files).strip_dirs().sort_stats("cumulative").print_stats(top)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "summarize":
+        print("用法：python profiling.py summarize [DIR] [--top N]")
+        sys.exit(1)
+    args = argv[1:]
+    top = 20
+    if "--top" in args:
+        i = args.index("--top")
+        top = int(args[i + 1])
+        del args[i:i + 2]
+    summarize(args[0] if args else PROFILE_DIR, top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# querybudget.py
+# 每個路由宣告「最多幾條 SQL」；超過就代表有 N+1（例如模板裡逐筆 lazy load c.services）。
+#   - 測試（app.testing）或 QUERY_BUDGET_STRICT=1：直接丟 QueryBudgetExceeded
+#   - debug 模式：log 出每條 SQL 以及觸發它的程式位置（含 lazy load 發生的那一行）
+#   - 正式環境預設關閉（QUERY_BUDGET=1 可強制開啟），只多一次屬性檢查
+import contextvars
+import os
+import time
+import traceback
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_active = contextvars.ContextVar("query_counters", default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    """路由執行的 SQL 數量超過宣告的上限。"""
+
+
+class QueryCounter:
+    def __init__(self, capture_stack: bool = False):
+        self.count = 0
+        self.seconds = 0.0  # SQL 執行總時間
+        self.capture_stack = capture_stack
+        self.statements = []  # [(sql, [程式位置...])]
+
+
+def _app_frames() -> list:
+    # 只留本專案的程式與模板，過濾掉 site-packages 與本檔
+    frames = []
+    for fr in traceback.extract_stack()[:-2]:
+        fn = os.path.abspath(fr.filename)
+        if not fn.startswith(BASE_DIR) or "site-packages" in fn or fn == os.path.abspath(__file__):
+            continue
+        frames.append(f"{os.path.relpath(fn, BASE_DIR)}:{fr.lineno} in {fr.name}")
+    return frames
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    counters = _active.get()
+    if not counters:
+        return
+    conn.info["query_started"] = time.perf_counter()
+    frames = None
+    for counter in counters:
+        counter.count += 1
+        if counter.capture_stack:
+            if frames is None:
+                frames = _app_frames()
+            counter.statements.append((statement, frames))
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _timing(conn, cursor, statement, parameters, context, executemany):
+    counters = _active.get()
+    started = conn.info.pop("query_started", None)
+    if not counters or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    for counter in counters:
+        counter.seconds += elapsed
+
+
+@contextmanager
+def count_queries(capture_stack: bool = False):
+    """
+    計算區塊內執行的 SQL 數量：
+        with count_queries() as q:
+            ...
+        assert q.count <= 3
+    """
+    counter = QueryCounter(capture_stack)
+    token = _active.set(_active.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active.reset(token)
+
+
+def _enabled(app) -> bool:
+    return app.debug or app.testing or os.environ.get("QUERY_BUDGET") == "1"
+
+
+def _strict(app) -> bool:
+    return app.testing or os.environ.get("QUERY_BUDGET_STRICT") == "1"
+
+
+def query_budget(max_queries: int):
+    """
+    路由裝飾器：宣告這個 endpoint 最多執行幾條 SQL（含模板裡的 lazy load）。
+    """
+    def deco(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            app = current_app
+            if not _enabled(app):
+                return view(*args, **kwargs)
+
+            with count_queries(capture_stack=app.debug or _strict(app)) as counter:
+                rv = view(*args, **kwargs)
+
+            if counter.count > max_queries:
+                lines = [f"query budget exceeded: {view.__name__} ran {counter.count} queries (budget {max_queries})"]
+                for i, (sql, frames) in enumerate(counter.statements, 1):
+                    lines.append(f"  [{i}] {' '.join(sql.split())[:200]}")
+                    lines.extend(f"        at {f}" for f in frames[-4:])
+                message = "\n".join(lines)
+                if _strict(app):
+                    raise QueryBudgetExceeded(message)
+                app.logger.warning(message)
+            return rv
+
+        wrapper.query_budget = max_queries
+        return wrapper
+    return deco
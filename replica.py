@@ -0,0 +1,80 @@
+# replica.py
+# 唯讀路由：單位查詢、匯出等只讀頁面改走 read replica（DATABASE_READ_URL），
+# 不跟用戶寫入搶同一個連線池。沒設定 replica 就一律走主庫。
+import os
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session as BaseSession
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+READ_BIND = "replica"
+
+# 用戶剛寫入後這幾秒內的讀取一律走主庫（replica 可能還沒同步到）
+READ_YOUR_WRITES_SECONDS = int(os.environ.get("READ_YOUR_WRITES_SECONDS", "10"))
+
+
+def read_database_url():
+    url = (os.environ.get("DATABASE_READ_URL") or "").strip()
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url or None
+
+
+class RoutingSession(BaseSession):
+    """
+    g.db_read_bind 有設定時，查詢改用該 bind 的 engine；flush（寫入）永遠走主庫。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            key = g.get("db_read_bind")
+            if key is not None and key in self._db.engines:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _remember_write(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def mark_recent_write(response):
+    """
+    after_request：這個請求有寫入主庫，記在用戶的 session cookie。
+    """
+    if g.get("db_wrote") and flask_session.get("teacher_id"):
+        flask_session["last_write_at"] = int(time.time())
+    return response
+
+
+def _recent_write() -> bool:
+    ts = flask_session.get("last_write_at")
+    return bool(ts) and time.time() - ts < READ_YOUR_WRITES_SECONDS
+
+
+def read_only(view):
+    """
+    只讀的 view 用這個裝飾：有 replica 就走 replica；replica 連不上就退回主庫重跑一次。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        db = current_app.extensions["sqlalchemy"]
+        if READ_BIND not in db.engines or _recent_write():
+            return view(*args, **kwargs)
+
+        g.db_read_bind = READ_BIND
+        try:
+            return view(*args, **kwargs)
+        except OperationalError as e:
+            print("⚠️ read replica failed, fallback to primary:", repr(e))
+            db.session.rollback()
+            g.db_read_bind = None
+            return view(*args, **kwargs)
+        finally:
+            g.db_read_bind = None
+
+    return wrapper
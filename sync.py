@@ -0,0 +1,253 @@
+# sync.py
+# 離線補登：用戶在沒訊號時先記在紙上/手機，之後一次把多筆上課紀錄送上來。
+import os
+from datetime import date
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import selectinload
+
+from models import db, Case, Session, SessionHours, hours_to_minutes, session_hours_rows, touch_teacher
+from usage import used_hours
+
+SYNC_MAX_RECORDS = int(os.environ.get("SYNC_MAX_RECORDS", "200"))
+API_TOKEN_MAX_AGE = int(os.environ.get("API_TOKEN_MAX_AGE", str(60 * 60 * 24 * 30)))
+
+
+class SyncError(Exception):
+    """整批無法處理（格式錯誤、筆數過多）。"""
+
+
+def make_cursor(teacher) -> str:
+    # cursor 就是用戶的 data_version：新增上課紀錄時同一個 transaction 把它 +1 並記在 sync_seq，
+    # 版本號依 commit 順序遞增，不會像 session id 那樣「小 id 晚 commit」而漏掉
+    return str(teacher.data_version or 0)
+
+
+def parse_cursor(raw) -> int:
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _parse_hours(raw):
+    try:
+        h = float(raw or 0)
+    except (TypeError, ValueError):
+        return None
+    # session_hours 以分鐘存整數
+    if h < 0 or hours_to_minutes(h) is None:
+        return None
+    return h
+
+
+def apply_batch(teacher, records) -> list:
+    """
+    驗證並套用一批上課紀錄，回傳逐筆結果。
+    合法的紀錄在同一個 transaction 內新增；呼叫端負責 commit。
+
+    每筆：{"key", "case_id", "session_date", "hours_orientation", "hours_life"}
+    結果 status：created / duplicate / error
+    """
+    if not isinstance(records, list):
+        raise SyncError("records 必須是陣列。")
+    if len(records) > SYNC_MAX_RECORDS:
+        raise SyncError(f"一次最多 {SYNC_MAX_RECORDS} 筆。")
+
+    records = [r if isinstance(r, dict) else {} for r in records]
+    keys = {str(r.get("key") or "") for r in records} - {""}
+    case_ids = set()
+    for r in records:
+        try:
+            case_ids.add(int(r.get("case_id")))
+        except (TypeError, ValueError):
+            pass
+
+    # 一次撈齊：案件（含項目）、已用時數、已存在的冪等鍵
+    # 案件先鎖住再算已用時數：同一案件的兩批並行送來，第二批會等第一批 commit 後再檢查核給上限
+    cases = {}
+    if case_ids:
+        cases = {
+            c.id: c for c in
+            Case.query.options(selectinload(Case.services))
+            .filter(Case.teacher_id == teacher.id, Case.id.in_(case_ids))
+            .with_for_update(of=Case)
+            .all()
+        }
+    used = used_hours(list(cases))
+    existing = {}
+    if keys:
+        existing = {
+            k: (sid, cid) for k, sid, cid in
+            db.session.query(Session.client_key, Session.id, Session.case_id)
+            .filter(Session.client_key.in_(keys))
+            .all()
+        }
+
+    results = []
+    pending = {}  # key -> 要新增的 row（同一批內重複的鍵）
+    for r in records:
+        key = str(r.get("key") or "")
+
+        def error(msg):
+            results.append({"key": key, "status": "error", "error": msg})
+
+        if not key or len(key) > 64:
+            error("key 必填且最長 64 字。")
+            continue
+
+        if key in existing:
+            sid, cid = existing[key]
+            if cases.get(cid) is None:
+                error("key 已被其他用戶使用。")
+            else:
+                results.append({"key": key, "status": "duplicate", "session_id": sid})
+            continue
+        if key in pending:
+            results.append({"key": key, "status": "duplicate", "session_id": None})
+            continue
+
+        try:
+            c = cases.get(int(r.get("case_id")))
+        except (TypeError, ValueError):
+            c = None
+        if c is None:
+            error("找不到案件。")
+            continue
+        if c.status != "active":
+            error("案件已結案，不能新增上課紀錄。")
+            continue
+
+        try:
+            session_date = date.fromisoformat(str(r.get("session_date") or ""))
+        except ValueError:
+            error("session_date 格式須為 YYYY-MM-DD。")
+            continue
+
+        ho = _parse_hours(r.get("hours_orientation"))
+        hl = _parse_hours(r.get("hours_life"))
+        if ho is None or hl is None or (ho == 0 and hl == 0):
+            error("請輸入有效時數（至少一項 > 0，最小到分鐘）。")
+            continue
+
+        services = {s.service_type: s for s in c.services}
+        case_used = used.setdefault(c.id, {})
+        used_o = case_used.get("orientation", 0.0)
+        used_l = case_used.get("life", 0.0)
+        if ho > 0 and "orientation" not in services:
+            error("此案件沒有定向項目。")
+            continue
+        if hl > 0 and "life" not in services:
+            error("此案件沒有生活項目。")
+            continue
+        if ho > 0 and used_o + ho > services["orientation"].granted_hours:
+            error(f"定向超過核給時數（剩餘 {services['orientation'].granted_hours - used_o}）。")
+            continue
+        if hl > 0 and used_l + hl > services["life"].granted_hours:
+            error(f"生活超過核給時數（剩餘 {services['life'].granted_hours - used_l}）。")
+            continue
+
+        pending[key] = {
+            "case_id": c.id,
+            "session_date": session_date,
+            "hours_orientation": ho,
+            "hours_life": hl,
+            "client_key": key,
+        }
+        case_used["orientation"] = used_o + ho
+        case_used["life"] = used_l + hl
+        results.append({"key": key, "status": "created", "session_id": None})
+
+    if not pending:
+        return results
+
+    # 整批一次寫入（executemany），再用冪等鍵一次查回 id；SQL 數量不隨筆數增加
+    touched = {row["case_id"] for row in pending.values()}
+    seq = touch_teacher(teacher)
+    db.session.execute(insert(Session), [dict(row, sync_seq=seq) for row in pending.values()])
+    db.session.execute(
+        update(Case).where(Case.id.in_(touched)).values(version=Case.version + 1)
+    )
+    db.session.expire_all()
+
+    ids = dict(
+        db.session.query(Session.client_key, Session.id)
+        .filter(Session.client_key.in_(list(pending)))
+        .all()
+    )
+    db.session.execute(insert(SessionHours), [
+        hrow
+        for key, row in pending.items()
+        for hrow in session_hours_rows(
+            ids[key], row["case_id"], row["session_date"],
+            {"orientation": row["hours_orientation"], "life": row["hours_life"]},
+        )
+    ])
+
+    for res in results:
+        if res["status"] != "error" and res["session_id"] is None:
+            res["session_id"] = ids.get(res["key"])
+    return results
+
+
+def changes_since(teacher, cursor) -> dict:
+    """
+    上次同步之後的變化：新增的上課紀錄；若案件有異動（data_version 不同）則附上全部案件摘要。
+    沒有 cursor（或 0）時回傳全部上課紀錄。
+    """
+    since = parse_cursor(cursor)
+    # 先取版本號再查紀錄，並以它為上限：之後才 commit 的留給下一次同步
+    version = teacher.data_version or 0
+
+    q = (
+        db.session.query(Session)
+        .join(Case, Case.id == Session.case_id)
+        .filter(Case.teacher_id == teacher.id)
+    )
+    if since:
+        q = q.filter(Session.sync_seq > since, Session.sync_seq <= version)
+    sessions = q.order_by(Session.id.asc()).all()
+
+    cases = None
+    if since != version:
+        all_cases = (
+            Case.query.options(selectinload(Case.services))
+            .filter_by(teacher_id=teacher.id)
+            .order_by(Case.id.asc())
+            .all()
+        )
+        used = used_hours([c.id for c in all_cases])
+        cases = []
+        for c in all_cases:
+            case_used = used.get(c.id, {})
+            cases.append({
+                "id": c.id,
+                "student_name": c.student_name,
+                "agency_name": c.agency_name,
+                "fiscal_year": c.fiscal_year,
+                "status": c.status,
+                "services": {
+                    s.service_type: {
+                        "start_date": s.start_date.isoformat(),
+                        "granted_hours": s.granted_hours,
+                        "used_hours": case_used.get(s.service_type, 0.0),
+                    }
+                    for s in c.services
+                },
+            })
+
+    return {
+        "cursor": make_cursor(teacher),
+        "sessions": [
+            {
+                "id": s.id,
+                "case_id": s.case_id,
+                "session_date": s.session_date.isoformat(),
+                "hours_orientation": s.hours_orientation,
+                "hours_life": s.hours_life,
+                "key": s.client_key,
+            }
+            for s in sessions
+        ],
+        "cases": cases,
+    }
@@ -0,0 +1,30 @@
+# tests/conftest.py
+# app 在 import 時就建好，環境變數要在任何測試模組 import app 之前設好。
+import os
+import sys
+import tempfile
+
+import pytest
+from cryptography.fernet import Fernet
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="whe-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'app.db')}"
+os.environ.setdefault("QUERY_CODE_KEY", Fernet.generate_key().decode())
+os.environ["HASH_WORKERS"] = "0"
+os.environ.pop("DATABASE_READ_URL", None)
+os.environ.pop("ENABLE_AUTO_CLEANUP", None)
+
+from app import app as _app  # noqa: E402
+from migrate import migrate  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    # 與部署相同：資料表由 migrate 建立，不是 create_app
+    with _app.app_context():
+        migrate()
+    _app.testing = True
+    return _app
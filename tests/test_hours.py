@@ -0,0 +1,57 @@
+# tests/test_hours.py
+# 時數輸入不是有限數字（nan、inf、超出 float 範圍）時要被擋下，不能變成 500。
+from datetime import date
+
+import pytest
+
+from app import app
+from models import Case, Session
+
+YEAR = date.today().year
+PASSWORD = "pw123456"
+NON_FINITE = ["nan", "inf", "-inf", "1e400"]
+
+
+@pytest.fixture(scope="module")
+def teacher():
+    client = app.test_client()
+    client.post("/teacher/login", data={
+        "full_name": "hours", "password": PASSWORD, "action": "signup", "email": "hours@example.com",
+    })
+    client.post("/teacher/cases/new", data={
+        "student_name": "hours-S", "agency_name": "啟明", "fiscal_year": str(YEAR),
+        "choose_orientation": "on", "granted_orientation": "10",
+        "choose_life": "on", "granted_life": "10",
+    })
+    token = client.post("/api/token", json={"full_name": "hours", "password": PASSWORD}).get_json()["token"]
+    with app.app_context():
+        case_id = Case.query.filter_by(student_name="hours-S").one().id
+    return {"client": client, "case_id": case_id, "auth": {"Authorization": f"Bearer {token}"}}
+
+
+def _session_count(case_id):
+    with app.app_context():
+        return Session.query.filter_by(case_id=case_id).count()
+
+
+@pytest.mark.parametrize("raw", NON_FINITE)
+def test_form_rejects_non_finite_hours(teacher, raw):
+    c, case_id = teacher["client"], teacher["case_id"]
+    resp = c.post(f"/teacher/cases/{case_id}", data={
+        "action": "add_session", "session_date": f"{YEAR}-03-04", "hours_orientation": raw, "hours_life": "1",
+    })
+    assert resp.status_code == 302
+    with c.session_transaction() as s:
+        assert any(category == "danger" for category, _ in s.get("_flashes", []))
+    assert _session_count(case_id) == 0
+
+
+@pytest.mark.parametrize("raw", NON_FINITE)
+def test_sync_rejects_non_finite_hours(teacher, raw):
+    resp = teacher["client"].post("/api/sync", headers=teacher["auth"], json={"records": [{
+        "key": f"hours-{raw}", "case_id": teacher["case_id"], "session_date": f"{YEAR}-03-04",
+        "hours_orientation": raw, "hours_life": 1,
+    }]})
+    assert resp.status_code == 200
+    assert resp.get_json()["results"][0]["status"] == "error"
+    assert _session_count(teacher["case_id"]) == 0
@@ -0,0 +1,105 @@
+# tests/test_query_budget.py
+# 每個宣告 @query_budget 的路由都在 app.testing 下實際跑一次：超過上限會直接丟 QueryBudgetExceeded。
+#
+# 執行：pip install pytest && python -m pytest -q
+from datetime import date
+
+import pytest
+
+from app import app
+from models import db, ArchivedCase, Case
+from archive import archive_fiscal_years
+from querybudget import QueryBudgetExceeded, query_budget
+
+YEAR = date.today().year
+PASSWORD = "pw123456"
+CASES = 3
+SESSIONS_PER_CASE = 4
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    app.testing = True
+    client = app.test_client()
+    client.post("/teacher/login", data={
+        "full_name": "budget", "password": PASSWORD, "action": "signup", "email": "budget@example.com",
+    })
+
+    codes = {}
+    ids = []
+    for i in range(CASES + 1):
+        # 最後一個案件放在去年，拿來封存
+        fiscal_year = YEAR if i < CASES else YEAR - 1
+        client.post("/teacher/cases/new", data={
+            "student_name": f"S{i}", "agency_name": "啟明", "fiscal_year": str(fiscal_year),
+            "choose_orientation": "on", "granted_orientation": "100",
+            "choose_life": "on", "granted_life": "100",
+        })
+        with client.session_transaction() as s:
+            codes[f"S{i}"] = s.get("one_time_code")
+        with app.app_context():
+            ids.append(Case.query.filter_by(student_name=f"S{i}").one().id)
+        for k in range(SESSIONS_PER_CASE):
+            client.post(f"/teacher/cases/{ids[i]}", data={
+                "action": "add_session", "session_date": f"{fiscal_year}-0{k + 1}-02",
+                "hours_orientation": "1", "hours_life": "0.5",
+            })
+
+    with app.app_context():
+        assert archive_fiscal_years(YEAR - 1) == 1
+        db.session.commit()
+        archived_id = ArchivedCase.query.filter_by(orig_id=ids[-1]).one().id
+
+    token = client.post("/api/token", json={"full_name": "budget", "password": PASSWORD}).get_json()["token"]
+    return {
+        "client": client, "codes": codes, "ids": ids, "archived_id": archived_id,
+        "auth": {"Authorization": f"Bearer {token}"},
+    }
+
+
+def _requests(seeded):
+    c, codes, auth = seeded["client"], seeded["codes"], seeded["auth"]
+    case_id, ids = seeded["ids"][0], seeded["ids"]
+    batch = [{"student_name": n, "code": codes[n]} for n in ("S0", "S1", "S2")]
+    # (endpoint, 預期狀態碼, 請求)
+    return [
+        ("dashboard", 200, lambda: c.get("/teacher/dashboard")),
+        ("case_detail", 200, lambda: c.get(f"/teacher/cases/{case_id}")),
+        ("case_detail", 302, lambda: c.post(f"/teacher/cases/{case_id}", data={
+            "action": "add_session", "session_date": f"{YEAR}-05-02", "hours_orientation": "1",
+        })),
+        ("teacher_export", 200, lambda: c.get(f"/teacher/export?year={YEAR}")),
+        ("archive_list", 200, lambda: c.get("/teacher/archive")),
+        ("archive_detail", 200, lambda: c.get(f"/teacher/archive/{seeded['archived_id']}")),
+        ("archive_export", 200, lambda: c.get(f"/teacher/archive/export?year={YEAR - 1}")),
+        ("lookup", 200, lambda: c.post("/lookup", data={
+            "agency_name": "啟明", "student_name": "S0", "code": codes["S0"],
+        })),
+        ("lookup_batch", 200, lambda: c.post("/lookup/batch", data={
+            "agency_name": "啟明", "items": "\n".join(f"{b['student_name']} {b['code']}" for b in batch),
+        })),
+        ("api_lookup_batch", 200, lambda: c.post("/api/lookup/batch", json={"agency_name": "啟明", "items": batch})),
+        ("api_sync", 200, lambda: c.get("/api/sync", headers=auth)),
+        ("api_sync", 200, lambda: c.post("/api/sync", headers=auth, json={"records": [
+            {"key": f"budget-{i}", "case_id": ids[i % CASES], "session_date": f"{YEAR}-06-02", "hours_orientation": 0.5}
+            for i in range(20)
+        ]})),
+    ]
+
+
+def test_routes_stay_within_budget(seeded):
+    for endpoint, status, call in _requests(seeded):
+        # 查詢失敗會導回查詢頁（302），所以要對狀態碼，確定跑到的是完整的成功路徑
+        assert call().status_code == status, endpoint
+
+
+def test_every_budgeted_route_is_exercised(seeded):
+    budgeted = {ep for ep, view in app.view_functions.items() if hasattr(view, "query_budget")}
+    assert budgeted == {ep for ep, _, _ in _requests(seeded)}
+
+
+def test_lowered_budget_raises(seeded, monkeypatch):
+    view = app.view_functions["case_detail"]
+    monkeypatch.setitem(app.view_functions, "case_detail", query_budget(2)(view))
+    with pytest.raises(QueryBudgetExceeded):
+        seeded["client"].get(f"/teacher/cases/{seeded['ids'][0]}")
@@ -0,0 +1,98 @@
+# tests/test_sync.py
+# 離線補登 /api/sync 的冪等鍵：重送、同批重複、別人的鍵、超過核給時數。
+from datetime import date
+
+import pytest
+
+from app import app
+from models import Case, Session
+
+YEAR = date.today().year
+PASSWORD = "pw123456"
+
+
+def _teacher(name):
+    client = app.test_client()
+    client.post("/teacher/login", data={
+        "full_name": name, "password": PASSWORD, "action": "signup", "email": f"{name}@example.com",
+    })
+    client.post("/teacher/cases/new", data={
+        "student_name": f"{name}-S", "agency_name": "啟明", "fiscal_year": str(YEAR),
+        "choose_orientation": "on", "granted_orientation": "2",
+        "choose_life": "on", "granted_life": "2",
+    })
+    token = client.post("/api/token", json={"full_name": name, "password": PASSWORD}).get_json()["token"]
+    with app.app_context():
+        case_id = Case.query.filter_by(student_name=f"{name}-S").one().id
+    auth = {"Authorization": f"Bearer {token}"}
+
+    def sync(*records):
+        resp = client.post("/api/sync", headers=auth, json={"records": list(records)})
+        assert resp.status_code == 200, resp.get_json()
+        return resp.get_json()["results"]
+
+    return case_id, sync
+
+
+@pytest.fixture(scope="module")
+def teachers():
+    return {"a": _teacher("sync-a"), "b": _teacher("sync-b")}
+
+
+def _record(key, case_id, **hours):
+    return {"key": key, "case_id": case_id, "session_date": f"{YEAR}-03-04", **hours}
+
+
+def _sessions(key):
+    with app.app_context():
+        return Session.query.filter_by(client_key=key).count()
+
+
+def test_resent_batch_is_duplicate(teachers):
+    case_id, sync = teachers["a"]
+    batch = [_record("resend-1", case_id, hours_orientation=0.5), _record("resend-2", case_id, hours_life=0.25)]
+
+    first = sync(*batch)
+    assert [r["status"] for r in first] == ["created", "created"]
+
+    again = sync(*batch)
+    assert [r["status"] for r in again] == ["duplicate", "duplicate"]
+    assert [r["session_id"] for r in again] == [r["session_id"] for r in first]
+    assert _sessions("resend-1") == _sessions("resend-2") == 1
+
+
+def test_repeated_key_in_one_batch(teachers):
+    case_id, sync = teachers["a"]
+    results = sync(
+        _record("same-batch", case_id, hours_orientation=0.5),
+        _record("same-batch", case_id, hours_orientation=0.5),
+    )
+    assert [r["status"] for r in results] == ["created", "duplicate"]
+    assert results[0]["session_id"] == results[1]["session_id"]
+    assert _sessions("same-batch") == 1
+
+
+def test_key_of_another_teacher(teachers):
+    case_a, sync_a = teachers["a"]
+    case_b, sync_b = teachers["b"]
+    assert sync_a(_record("shared-key", case_a, hours_life=0.5))[0]["status"] == "created"
+
+    result = sync_b(_record("shared-key", case_b, hours_life=0.5))[0]
+    assert result["status"] == "error"
+    assert result["error"] == "key 已被其他用戶使用。"
+    assert "session_id" not in result
+
+
+def test_over_granted_hours(teachers):
+    case_id, sync = teachers["b"]
+    results = sync(
+        _record("grant-1", case_id, hours_orientation=1.5),
+        _record("grant-2", case_id, hours_orientation=1),
+    )
+    assert [r["status"] for r in results] == ["created", "error"]
+    assert "超過核給時數" in results[1]["error"]
+    assert _sessions("grant-2") == 0
+
+    # 被拒的那筆不算已用：剩下的時數還能補登
+    assert sync(_record("grant-3", case_id, hours_orientation=0.5))[0]["status"] == "created"
+    assert sync(_record("grant-4", case_id, hours_orientation=0.25))[0]["status"] == "error"
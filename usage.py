@@ -0,0 +1,66 @@
+# usage.py
+import math
+from datetime import date, timedelta
+from functools import lru_cache
+
+from sqlalchemy import extract, func
+
+from models import db, SessionHours, minutes_to_hours
+
+
+@lru_cache(maxsize=512)
+def _monthly_usage(case_id: int, version: int, created_at) -> tuple:
+    # created_at 也放進 key：SQLite 刪案後 id 可能被重用，避免拿到舊案件的快取
+    y = extract("year", SessionHours.session_date)
+    m = extract("month", SessionHours.session_date)
+    rows = (
+        db.session.query(y, m, SessionHours.category, func.sum(SessionHours.minutes))
+        .filter(SessionHours.case_id == case_id)
+        .group_by(y, m, SessionHours.category)
+        .order_by(y, m)
+        .all()
+    )
+    months = {}
+    for yy, mm, category, minutes in rows:
+        months.setdefault(f"{int(yy):04d}-{int(mm):02d}", {})[category] = minutes_to_hours(minutes)
+    return tuple(months.items())
+
+
+def monthly_usage(c) -> tuple:
+    """
+    每月各項目時數合計：((YYYY-MM, {項目: 時數}), ...)，依月份排序。
+    一次 GROUP BY 查詢（只走 session_hours 索引）；同一案件版本只查一次。
+    """
+    return _monthly_usage(c.id, c.version or 0, c.created_at)
+
+
+def used_hours(case_ids) -> dict:
+    """
+    多個案件的已用時數：{case_id: {項目: 時數}}，一次 GROUP BY 查詢。
+    """
+    if not case_ids:
+        return {}
+    rows = (
+        db.session.query(SessionHours.case_id, SessionHours.category, func.sum(SessionHours.minutes))
+        .filter(SessionHours.case_id.in_(case_ids))
+        .group_by(SessionHours.case_id, SessionHours.category)
+        .all()
+    )
+    used = {}
+    for cid, category, minutes in rows:
+        used.setdefault(cid, {})[category] = minutes_to_hours(minutes)
+    return used
+
+
+def project_run_out(granted: float, used: float, start_date: date, today: date = None):
+    """
+    依「開始日到今天」的平均使用速度，推估核給時數用完的日期。
+    已用完或資料不足（尚未開始/尚無時數）回傳 None。
+    """
+    today = today or date.today()
+    remaining = granted - used
+    days = (today - start_date).days
+    if remaining <= 0 or used <= 0 or days <= 0:
+        return None
+    per_day = used / days
+    return today + timedelta(days=math.ceil(remaining / per_day))